@@ -5,7 +5,7 @@ Agents:
 - SpeechAgent: Audio → Text transcription
 - ClarificationAgent: Multi-turn dialog for intent clarification
 - IntentAgent: Text → User intent analysis  
-- ScriptAnalyzerAgent: Analyzes and segments scripts into scenes
+- ScriptAnalyzerAgent: Extracts intent and segments scripts into scenes
 - PromptAgent: Intent → Video prompt generation
 - VideoAgent: Prompt → Video generation with Veo 2
 - VideoStitchAgent: Concatenates multiple videos
@@ -4,44 +4,110 @@ All agents inherit from this class
 """
 from abc import ABC, abstractmethod
 from typing import Any, Dict, Optional, Callable
-from datetime import datetime
+from contextvars import ContextVar
+from datetime import datetime, timezone
 import asyncio
+import hashlib
+
+from services.llm_cache import llm_cache, cache_key
+
+
+# Prompt key -> future of the Gemini call currently running for it (shared by all agents)
+_inflight: Dict[str, asyncio.Future] = {}
 
 
 class BaseAgent(ABC):
     """
     Base class for all agents in the system.
     Each agent has a specific responsibility and can process tasks independently.
+    
+    Agents are shared singletons, so handlers are kept in context variables:
+    each asyncio task (e.g. each task manager job) sees only the handlers it set.
     """
     
     def __init__(self, name: str, description: str = ""):
         self.name = name
         self.description = description
-        self._on_message: Optional[Callable] = None
-        self._on_progress: Optional[Callable] = None
+        self._on_message: ContextVar[Optional[Callable]] = ContextVar(f"{name}.on_message", default=None)
+        self._on_progress: ContextVar[Optional[Callable]] = ContextVar(f"{name}.on_progress", default=None)
     
     def set_message_handler(self, handler: Callable):
-        """Set callback for sending messages during processing"""
-        self._on_message = handler
+        """Set callback for sending messages during processing (current task only)"""
+        self._on_message.set(handler)
     
     def set_progress_handler(self, handler: Callable):
-        """Set callback for progress updates"""
-        self._on_progress = handler
+        """Set callback for progress updates (current task only)"""
+        self._on_progress.set(handler)
     
     async def send_message(self, message: str, data: Optional[Dict] = None):
         """Send a status message"""
-        if self._on_message:
-            await self._on_message({
+        on_message = self._on_message.get()
+        if on_message:
+            await on_message({
                 "agent": self.name,
                 "message": message,
                 "data": data,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now(timezone.utc).isoformat()
             })
     
     async def update_progress(self, progress: int, message: str):
         """Update progress percentage"""
-        if self._on_progress:
-            await self._on_progress(progress, message)
+        on_progress = self._on_progress.get()
+        if on_progress:
+            await on_progress(progress, message)
+    
+    async def generate_content(self, contents: Any, model: str = "gemini-2.5-flash"):
+        """
+        Gemini generate_content on self.client, run in a thread so the event loop stays responsive.
+        Concurrent calls with the same text prompt (e.g. repeated scenes) share one request.
+        """
+        if not isinstance(contents, str):
+            return await asyncio.to_thread(self.client.models.generate_content, model=model, contents=contents)
+        
+        key = hashlib.sha256(f"{model}\n{contents}".encode()).hexdigest()
+        shared = _inflight.get(key)
+        if shared is not None:
+            return await asyncio.shield(shared)
+        
+        future = asyncio.get_running_loop().create_future()
+        _inflight[key] = future
+        try:
+            response = await asyncio.to_thread(self.client.models.generate_content, model=model, contents=contents)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved in case nobody else was waiting
+            raise
+        finally:
+            if not future.done():
+                future.set_exception(RuntimeError("Shared Gemini call was cancelled"))
+                future.exception()
+            _inflight.pop(key, None)
+    
+    async def generate_text(
+        self,
+        prompt: str,
+        cache: bool = False,
+        parse: Optional[Callable[[str], Any]] = None,
+        model: str = "gemini-2.5-flash"
+    ) -> Any:
+        """
+        Response text of generate_content ("" if none), or parse(text) when parse is given.
+        With cache=True identical prompts are answered from the persistent LLM response
+        cache; a reply is only stored once parse accepted it, so bad output isn't replayed.
+        """
+        key = cache_key(model, prompt) if cache else None
+        text = await llm_cache.get(key) if key else None
+        fresh = text is None
+        if fresh:
+            response = await self.generate_content(prompt, model)
+            text = response.text if response and response.text else ""
+        
+        result = parse(text) if parse and text else text
+        if key and fresh and text:
+            await llm_cache.set(key, text)
+        return result
     
     @abstractmethod
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
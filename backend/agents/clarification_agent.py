@@ -2,11 +2,36 @@
 Clarification Agent - Analyzes user intent and asks clarifying questions
 Ensures complete understanding before video generation
 """
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from collections import OrderedDict
 import json
+import re
+import time
 
+import orjson
+
+from services.encoding import strip_json_fence
 from .base import BaseAgent
 
+# Start of the (possibly still incomplete) "ai_response" string in streamed JSON
+_AI_RESPONSE_RE = re.compile(r'"ai_response"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def _partial_ai_response(raw: str) -> str:
+    """Decode as much of the ai_response string value as has arrived so far"""
+    match = _AI_RESPONSE_RE.search(raw)
+    if not match:
+        return ""
+    body = match.group(1)
+    try:
+        return json.loads('"' + body + '"')
+    except ValueError:
+        # Cut a trailing partial escape such as "\u00"
+        try:
+            return json.loads('"' + body[:body.rfind("\\")] + '"')
+        except ValueError:
+            return ""
+
 
 class ClarificationAgent(BaseAgent):
     """
@@ -29,6 +54,10 @@ class ClarificationAgent(BaseAgent):
         )
         self.client = None
         self._initialized = False
+        # (text, canonical intent JSON) -> (stored at, result); absorbs re-sent messages
+        self.cache_ttl = 30.0
+        self.cache_size = 256
+        self._cache: "OrderedDict[Tuple[str, bytes], Tuple[float, Dict[str, Any]]]" = OrderedDict()
     
     def initialize(self, client):
         """Initialize with Gemini client"""
@@ -62,12 +91,80 @@ class ClarificationAgent(BaseAgent):
             # Fallback: simple keyword analysis
             return self._fallback_analysis(text, current_intent)
         
+        # Same message against the same intent (retry/refresh) reuses the recent answer
+        now = time.monotonic()
+        cache_key = (text, orjson.dumps(current_intent, option=orjson.OPT_SORT_KEYS))
+        cached = self._cache.get(cache_key)
+        if cached and now - cached[0] < self.cache_ttl:
+            return dict(cached[1])
+        
+        try:
+            prompt = self._build_prompt(text, history, current_intent)
+            
+            response = await self.generate_content(prompt)
+            
+            if not response or not response.text:
+                return self._fallback_analysis(text, current_intent)
+            
+            analysis = self._finalize(response.text, text, current_intent)
+            self._remember(cache_key, now, analysis)
+            return dict(analysis)
+            
+        except Exception as e:
+            print(f"Clarification analysis failed: {e}")
+            return self._fallback_analysis(text, current_intent)
+    
+    async def run_stream(self, input_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of process() for the conversation WebSocket.
+        Yields {"type": "token", "delta": str} as the ai_response text arrives,
+        then one {"type": "result", "result": {...}} with the same shape process() returns.
+        """
+        text = input_data.get("text", "")
+        history = input_data.get("conversation_history", [])
+        current_intent = input_data.get("current_intent", {})
+        
+        now = time.monotonic()
+        cache_key = (text, orjson.dumps(current_intent, option=orjson.OPT_SORT_KEYS))
+        cached = self._cache.get(cache_key)
+        
+        if not text or not self._initialized or not self.client or (cached and now - cached[0] < self.cache_ttl):
+            result = await self.process(input_data)
+            if result.get("ai_response"):
+                yield {"type": "token", "delta": result["ai_response"]}
+            yield {"type": "result", "result": result}
+            return
+        
+        raw = ""
+        sent = 0
         try:
-            # Build conversation context
-            context = self._build_context(history)
+            stream = await self.client.aio.models.generate_content_stream(
+                model="gemini-2.5-flash",
+                contents=self._build_prompt(text, history, current_intent)
+            )
+            async for chunk in stream:
+                raw += chunk.text or ""
+                partial = _partial_ai_response(raw)
+                if len(partial) > sent:
+                    yield {"type": "token", "delta": partial[sent:]}
+                    sent = len(partial)
             
-            # Use Gemini to analyze
-            prompt = f"""You are analyzing a user's video creation request to determine if we have enough information.
+            analysis = self._finalize(raw, text, current_intent)
+            self._remember(cache_key, now, analysis)
+            result = dict(analysis)
+        except Exception as e:
+            print(f"Clarification stream failed: {e}")
+            result = self._fallback_analysis(text, current_intent)
+            if not sent:
+                yield {"type": "token", "delta": result["ai_response"]}
+        
+        yield {"type": "result", "result": result}
+    
+    def _build_prompt(self, text: str, history: List[Dict], current_intent: Dict) -> str:
+        """Analysis prompt; ai_response comes first in the JSON so it can be streamed early"""
+        context = self._build_context(history)
+        
+        return f"""You are analyzing a user's video creation request to determine if we have enough information.
 
 Previous conversation:
 {context}
@@ -92,6 +189,7 @@ Rules:
 
 Return a JSON object:
 {{
+    "ai_response": "friendly response to user",
     "updated_intent": {{
         "topic": "extracted topic or null",
         "style": "extracted style or null", 
@@ -102,52 +200,44 @@ Return a JSON object:
     }},
     "needs_clarification": true/false,
     "questions": ["question1", "question2"] or [],
-    "ready_to_generate": true/false,
-    "ai_response": "friendly response to user"
+    "ready_to_generate": true/false
 }}
 
 Return ONLY valid JSON, no markdown."""
-
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-            
-            if not response or not response.text:
-                return self._fallback_analysis(text, current_intent)
-            
-            # Parse response
-            response_text = response.text.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-            
-            result = json.loads(response_text.strip())
-            
-            # Merge with current intent
-            updated_intent = result.get("updated_intent", {})
-            for key, value in current_intent.items():
-                if key not in updated_intent or updated_intent[key] is None:
-                    updated_intent[key] = value
-            
-            # Accumulate original input
-            prev_input = current_intent.get("original_input", "")
-            new_input = text
-            updated_intent["original_input"] = f"{prev_input} {new_input}".strip()
-            
-            return {
-                "success": True,
-                "needs_clarification": result.get("needs_clarification", False),
-                "questions": result.get("questions", []),
-                "updated_intent": updated_intent,
-                "ready_to_generate": result.get("ready_to_generate", False),
-                "ai_response": result.get("ai_response", "")
-            }
-            
-        except Exception as e:
-            print(f"Clarification analysis failed: {e}")
-            return self._fallback_analysis(text, current_intent)
+    
+    def _finalize(self, raw: str, text: str, current_intent: Dict) -> Dict[str, Any]:
+        """Parse the model's JSON and merge it into the accumulated intent"""
+        result = json.loads(strip_json_fence(raw))
+        
+        # Merge with current intent
+        updated_intent = result.get("updated_intent", {})
+        for key, value in current_intent.items():
+            if key not in updated_intent or updated_intent[key] is None:
+                updated_intent[key] = value
+        
+        # Accumulate original input
+        prev_input = current_intent.get("original_input", "")
+        new_input = text
+        updated_intent["original_input"] = f"{prev_input} {new_input}".strip()
+        
+        return {
+            "success": True,
+            "needs_clarification": result.get("needs_clarification", False),
+            "questions": result.get("questions", []),
+            "updated_intent": updated_intent,
+            "ready_to_generate": result.get("ready_to_generate", False),
+            "ai_response": result.get("ai_response", "")
+        }
+    
+    def _remember(self, key: Tuple[str, bytes], now: float, analysis: Dict[str, Any]):
+        """Cache an analysis, purging expired entries and bounding the size"""
+        self._cache[key] = (now, analysis)
+        self._cache.move_to_end(key)
+        while self._cache:
+            oldest_key, (stored_at, _) = next(iter(self._cache.items()))
+            if now - stored_at < self.cache_ttl and len(self._cache) <= self.cache_size:
+                break
+            del self._cache[oldest_key]
     
     def _build_context(self, history: List[Dict]) -> str:
         """Build conversation context string"""
@@ -5,9 +5,22 @@ Analyzes text input to extract video requirements
 from typing import Any, Dict
 import json
 
+from services.encoding import strip_json_fence
 from .base import BaseAgent
 
 
+def complete_intent(intent: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """Fill in defaults for fields the LLM left out"""
+    intent["original_input"] = text
+    intent.setdefault("topic", text[:100])
+    intent.setdefault("video_type", "short video")
+    intent.setdefault("style", "cinematic")
+    intent.setdefault("mood", "engaging")
+    intent.setdefault("duration", 8)
+    intent.setdefault("key_elements", [])
+    return intent
+
+
 class IntentAgent(BaseAgent):
     """
     Agent responsible for understanding user's intent.
@@ -64,38 +77,15 @@ Return a JSON object with these fields:
 
 Return ONLY valid JSON, no markdown formatting."""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
+            # Parse JSON response (markdown code blocks stripped if present)
+            intent = await self.generate_text(
+                prompt, cache=True,
+                parse=lambda raw: complete_intent(json.loads(strip_json_fence(raw)), text)
             )
             
-            if not response or not response.text:
+            if not intent:
                 return self._fallback_intent(text)
             
-            # Parse JSON response
-            response_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                parts = response_text.split("```")
-                if len(parts) >= 2:
-                    response_text = parts[1]
-            
-            response_text = response_text.strip()
-            
-            intent = json.loads(response_text)
-            intent["original_input"] = text
-            
-            # Ensure required fields exist
-            intent.setdefault("topic", text[:100])
-            intent.setdefault("video_type", "short video")
-            intent.setdefault("style", "cinematic")
-            intent.setdefault("mood", "engaging")
-            intent.setdefault("duration", 8)
-            intent.setdefault("key_elements", [])
-            
             await self.send_message(f"Understood: {intent['video_type']} about {intent['topic'][:30]}")
             
             return {
@@ -2,8 +2,13 @@
 Orchestrator Agent - Coordinates all agents in Multi-Agent Architecture
 Supports both single-scene and multi-scene video generation
 """
-from typing import Any, Dict, List, Optional, Callable
-from datetime import datetime
+from typing import Any, Dict, Optional, Callable
+from collections import ChainMap
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+import asyncio
+import hashlib
 import os
 
 from google import genai
@@ -14,23 +19,60 @@ from .clarification_agent import clarification_agent
 from .intent_agent import intent_agent
 from .script_analyzer_agent import script_analyzer_agent
 from .prompt_agent import prompt_agent
-from .video_agent import video_agent
+from .video_agent import video_agent, MAX_WAIT, RETRY_DELAY, DOWNLOAD_TIMEOUT
 from .video_stitch_agent import video_stitch_agent
 from models.schemas import TaskPhase
 
 
+# Inputs shorter than this (ASCII only - CJK packs far more per character)
+# are rejected before any LLM call
+MIN_INPUT_CHARS = 8
+
+# Upper bound for one scene's Veo generation: every VideoAgent attempt (wait and
+# retry pause) plus a download, so the scene never times out before its last retry
+SCENE_TIMEOUT = int(
+    os.getenv("SCENE_TIMEOUT")
+    or (video_agent.max_retries + 1) * (MAX_WAIT + RETRY_DELAY) + DOWNLOAD_TIMEOUT
+)
+
+
+@dataclass
+class SceneProgressMapper:
+    """
+    Maps VideoAgent progress (60-90) onto one scene's slice of the 40-90 range.
+    Integer-only so mapped progress never jitters backwards from rounding.
+    """
+    start: int
+    end: int
+    scene_num: int
+    total: int
+    report: Callable
+    
+    def map(self, p: int) -> int:
+        return min(self.end, self.start + (p - 60) * (self.end - self.start) // 30)
+    
+    async def __call__(self, p: int, m: str):
+        await self.report(TaskPhase.EXECUTION, self.map(p), f"Scene {self.scene_num}/{self.total}: {m}")
+
+
 class OrchestratorAgent(BaseAgent):
     """
     Master agent coordinating the video generation pipeline.
     
-    Single-scene: SpeechAgent → IntentAgent → PromptAgent → VideoAgent
-    Multi-scene:  SpeechAgent → IntentAgent → ScriptAnalyzerAgent 
+    Single-scene: SpeechAgent → ScriptAnalyzerAgent → PromptAgent → VideoAgent
+    Multi-scene:  SpeechAgent → ScriptAnalyzerAgent
                   → [PromptAgent → VideoAgent] × N → VideoStitchAgent
+    
+    ScriptAnalyzerAgent extracts intent and scenes in one LLM call;
+    IntentAgent is only used when the analyzer returns no intent.
     """
     
+    # genai clients shared across initialize() calls, keyed by API key fingerprint
+    _clients: Dict[str, genai.Client] = {}
+    
     def __init__(self):
         super().__init__(name="Orchestrator", description="Coordinates all agents")
-        self._status_callback: Optional[Callable] = None
+        self._status_callback: ContextVar[Optional[Callable]] = ContextVar("orchestrator.status", default=None)
         self._initialized = False
         self.client = None
         self.api_key = None
@@ -44,7 +86,7 @@ class OrchestratorAgent(BaseAgent):
             return False
         
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = self._get_client(self.api_key)
             speech_agent.initialize(self.client)
             clarification_agent.initialize(self.client)
             intent_agent.initialize(self.client)
@@ -59,12 +101,36 @@ class OrchestratorAgent(BaseAgent):
             print(f"Failed to initialize: {e}")
             return False
     
+    @classmethod
+    def _get_client(cls, api_key: str) -> genai.Client:
+        """Reuse the client for this API key instead of building a new one"""
+        key = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        client = cls._clients.get(key)
+        if client is None:
+            client = cls._clients[key] = genai.Client(api_key=api_key)
+        return client
+    
+    @classmethod
+    def reset_clients(cls):
+        """Drop cached clients (e.g. for test isolation or key rotation)"""
+        cls._clients.clear()
+    
+    @staticmethod
+    def _is_trivial_input(text: str) -> bool:
+        """Cheap gate for noise/garbage input (saves the Intent/Script LLM hops)"""
+        text = text.strip()
+        if not any(c.isalpha() for c in text):
+            return True
+        return text.isascii() and len(text) < MIN_INPUT_CHARS
+    
     def set_status_handler(self, handler: Callable):
-        self._status_callback = handler
+        """Set the status callback for the pipeline run in the current task"""
+        self._status_callback.set(handler)
     
     async def update_status(self, phase: TaskPhase, progress: int, message: str, data: Optional[Dict] = None):
-        if self._status_callback:
-            await self._status_callback({
+        status_callback = self._status_callback.get()
+        if status_callback:
+            await status_callback({
                 "phase": phase.value, "progress": progress, 
                 "message": message, "data": data or {}
             })
@@ -77,55 +143,64 @@ class OrchestratorAgent(BaseAgent):
         )
     
     async def process_video_request(
-        self, task_id: str, audio_data: Optional[str] = None, text_input: Optional[str] = None
+        self, task_id: str, audio_data: Optional[str] = None, text_input: Optional[str] = None,
+        audio_bytes: Optional[bytes] = None, audio_mime_type: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Main pipeline with multi-scene support"""
+        """Main pipeline with multi-scene support (audio as base64 audio_data or raw audio_bytes)"""
         try:
             transcription = ""
             
             # ========== Step 1: Speech to Text ==========
-            if audio_data:
+            if audio_data or audio_bytes:
                 await self.update_status(TaskPhase.UNDERSTANDING, 5, "SpeechAgent processing...")
                 
                 async def progress_cb(p, m): await self.update_status(TaskPhase.UNDERSTANDING, p, m)
                 speech_agent.set_progress_handler(progress_cb)
                 
-                result = await speech_agent.run({"audio_data": audio_data})
+                result = await speech_agent.run({
+                    "audio_data": audio_data, "audio_bytes": audio_bytes, "mime_type": audio_mime_type
+                })
                 if not result.get("success"):
                     return {"success": False, "error": result.get("error", "Speech failed")}
                 transcription = result.get("transcription", "")
             else:
                 transcription = text_input or ""
             
+            # Transcribed - release the (multi-MB) audio for the rest of the run
+            audio_data = audio_bytes = None
+            
             if not transcription:
                 await self.update_status(TaskPhase.UNDERSTANDING, 0, "No input detected")
                 return {"success": False, "error": "No transcription"}
             
+            if self._is_trivial_input(transcription):
+                await self.update_status(TaskPhase.UNDERSTANDING, 0, "Input too short")
+                return {"success": False, "error": "Input too short", "transcription": transcription}
+            
             await self.update_status(
                 TaskPhase.UNDERSTANDING, 15, f"Heard: \"{transcription[:60]}...\"",
                 data={"transcription": transcription}
             )
             
-            # ========== Step 2: Intent Analysis ==========
-            await self.update_status(TaskPhase.UNDERSTANDING, 20, "IntentAgent analyzing...")
+            # ========== Step 2: Script Analysis (intent + multi-scene detection) ==========
+            await self.update_status(TaskPhase.UNDERSTANDING, 20, "ScriptAnalyzerAgent analyzing request...")
             
-            result = await intent_agent.run({"text": transcription})
-            if not result.get("success"):
-                return {"success": False, "error": result.get("error", "Intent failed")}
-            intent = result.get("intent", {})
+            # The analyzer reports its own small percentages; never move the bar back below 20
+            async def script_progress(p, m): await self.update_status(TaskPhase.PLANNING, max(p, 20), m)
+            script_analyzer_agent.set_progress_handler(script_progress)
             
-            await self.update_status(TaskPhase.UNDERSTANDING, 25, f"Intent: {intent.get('video_type', 'video')}")
+            result = await script_analyzer_agent.run({"text": transcription})
+            intent = result.get("intent")
             
-            # ========== Step 3: Script Analysis (Multi-scene detection) ==========
-            await self.update_status(TaskPhase.PLANNING, 30, "ScriptAnalyzerAgent analyzing structure...")
+            # ========== Step 3: Intent Analysis (only if the analyzer had none) ==========
+            if not intent:
+                intent_result = await intent_agent.run({"text": transcription})
+                if not intent_result.get("success"):
+                    return {"success": False, "error": intent_result.get("error", "Intent failed")}
+                intent = intent_result.get("intent", {})
             
-            async def script_progress(p, m): await self.update_status(TaskPhase.PLANNING, p, m)
-            script_analyzer_agent.set_progress_handler(script_progress)
-            
-            result = await script_analyzer_agent.run({
-                "text": transcription,
-                "intent": intent
-            })
+            # Reported after the analyzer's PLANNING updates, so it is PLANNING too
+            await self.update_status(TaskPhase.PLANNING, 30, f"Intent: {intent.get('video_type', 'video')}")
             
             if not result.get("success"):
                 # Fallback to single scene
@@ -150,73 +225,96 @@ class OrchestratorAgent(BaseAgent):
             video_paths = []
             video_prompts = []
             
-            for i, scene in enumerate(scenes):
-                scene_num = i + 1
-                scene_desc = scene.get("description", scene.get("title", f"Scene {scene_num}"))
-                
-                # Calculate progress for this scene
-                # Each scene gets equal portion of 40-90 range
-                scene_progress_start = 40 + int((i / total_scenes) * 50)
-                scene_progress_end = 40 + int(((i + 1) / total_scenes) * 50)
-                
-                # 4a: Generate prompt for this scene
-                await self.update_status(
-                    TaskPhase.EXECUTION, 
-                    scene_progress_start, 
-                    f"Scene {scene_num}/{total_scenes}: Creating prompt..."
-                )
-                
-                # Create scene-specific intent
-                scene_intent = {
-                    **intent,
-                    "topic": scene_desc,
-                    "original_input": scene_desc,
-                    "scene_number": scene_num,
-                    "total_scenes": total_scenes
-                }
-                
-                result = await prompt_agent.run({"intent": scene_intent})
-                if not result.get("success"):
-                    video_prompts.append(f"Scene {scene_num}: {scene_desc}")
-                else:
-                    video_prompts.append(result.get("prompt", scene_desc))
-                
-                # 4b: Generate video for this scene
-                scene_task_id = f"{task_id}_scene{scene_num}"
-                
-                await self.update_status(
-                    TaskPhase.EXECUTION,
-                    scene_progress_start + 5,
-                    f"Scene {scene_num}/{total_scenes}: Generating video with Veo 2..."
-                )
-                
-                # Progress callback for video generation
-                async def video_progress(p, m):
-                    # Map video progress (60-90) to scene's progress range
-                    mapped_progress = scene_progress_start + int((p - 60) / 30 * (scene_progress_end - scene_progress_start))
+            # Each scene gets equal portion of 40-90 range
+            scene_progress_ranges = [
+                (40 + i * 50 // total_scenes, 40 + (i + 1) * 50 // total_scenes)
+                for i in range(total_scenes)
+            ]
+            
+            scene_descs = [
+                scene.get("description", scene.get("title", f"Scene {i + 1}"))
+                for i, scene in enumerate(scenes)
+            ]
+            
+            # Prompts don't depend on any video, so all scenes' prompts are generated up front,
+            # concurrently with each other, the Veo connection warm-up and earlier scenes' videos
+            warmup = asyncio.create_task(video_agent.warm_up())
+            prompt_tasks = [
+                asyncio.create_task(prompt_agent.run({
+                    # Scene-specific intent (overlays the shared intent, no copy)
+                    "intent": ChainMap({
+                        "topic": scene_desc,
+                        "original_input": scene_desc,
+                        "scene_number": i + 1,
+                        "total_scenes": total_scenes
+                    }, intent)
+                }))
+                for i, scene_desc in enumerate(scene_descs)
+            ]
+            
+            try:
+                for i, scene_desc in enumerate(scene_descs):
+                    scene_num = i + 1
+                    scene_progress_start, scene_progress_end = scene_progress_ranges[i]
+                    
+                    # 4a: Collect the prompt for this scene (usually already done)
                     await self.update_status(
                         TaskPhase.EXECUTION, 
-                        mapped_progress, 
-                        f"Scene {scene_num}/{total_scenes}: {m}"
+                        scene_progress_start, 
+                        f"Scene {scene_num}/{total_scenes}: Creating prompt..."
                     )
-                
-                video_agent.set_progress_handler(video_progress)
-                
-                result = await video_agent.run({
-                    "prompt": video_prompts[-1],
-                    "task_id": scene_task_id
-                })
-                
-                if result.get("success") and result.get("video_path"):
-                    video_paths.append(result.get("video_path"))
+                    
+                    result = await prompt_tasks[i]
+                    if not result.get("success"):
+                        video_prompts.append(f"Scene {scene_num}: {scene_desc}")
+                    else:
+                        video_prompts.append(result.get("prompt", scene_desc))
+                    
+                    # 4b: Generate video for this scene
+                    scene_task_id = f"{task_id}_scene{scene_num}"
+                    
                     await self.update_status(
                         TaskPhase.EXECUTION,
-                        scene_progress_end,
-                        f"Scene {scene_num}/{total_scenes}: ✓ Complete"
+                        scene_progress_start + 5,
+                        f"Scene {scene_num}/{total_scenes}: Generating video with Veo 2..."
                     )
-                else:
-                    print(f"Scene {scene_num} generation failed: {result.get('error')}")
-                    # Continue with other scenes
+                    
+                    # Progress callback for video generation
+                    video_agent.set_progress_handler(SceneProgressMapper(
+                        scene_progress_start, scene_progress_end, scene_num, total_scenes, self.update_status
+                    ))
+                    
+                    try:
+                        result = await asyncio.wait_for(
+                            video_agent.run({
+                                "prompt": video_prompts[-1],
+                                "task_id": scene_task_id
+                            }),
+                            timeout=SCENE_TIMEOUT
+                        )
+                    except asyncio.TimeoutError:
+                        result = {"success": False, "error": f"Timed out after {SCENE_TIMEOUT}s"}
+                    
+                    if result.get("success") and result.get("video_path"):
+                        video_paths.append(result.get("video_path"))
+                        await self.update_status(
+                            TaskPhase.EXECUTION,
+                            scene_progress_end,
+                            f"Scene {scene_num}/{total_scenes}: ✓ Complete"
+                        )
+                    else:
+                        # Continue with other scenes
+                        print(f"Scene {scene_num} generation failed: {result.get('error')}")
+                        await self.update_status(
+                            TaskPhase.EXECUTION,
+                            scene_progress_end,
+                            f"Scene {scene_num}/{total_scenes}: ✗ Failed",
+                            data={"failed_scene": scene_num, "error": result.get("error")}
+                        )
+            finally:
+                # Nothing left to overlap with if the pipeline bails out early
+                for pending in (warmup, *prompt_tasks):
+                    pending.cancel()
             
             # ========== Step 5: Stitch Videos (if multi-scene) ==========
             if len(video_paths) == 0:
@@ -240,11 +338,11 @@ class OrchestratorAgent(BaseAgent):
                 if result.get("success"):
                     video_url = result.get("video_url")
                 else:
-                    # Fallback to first video
-                    video_url = f"/api/video/file/{task_id}_scene1.mp4"
+                    # Fallback to first successfully generated scene
+                    video_url = f"/api/video/file/{Path(video_paths[0]).name}"
             else:
                 # Single video
-                video_url = f"/api/video/file/{task_id}_scene1.mp4" if is_multi_scene else f"/api/video/file/{task_id}.mp4"
+                video_url = f"/api/video/file/{Path(video_paths[0]).name}"
             
             # ========== Complete ==========
             await self.update_status(TaskPhase.COMPLETED, 100, 
@@ -50,6 +50,7 @@ class PromptAgent(BaseAgent):
             await self.update_progress(45, "Creating video prompt...")
             
             original_input = intent.get('original_input', '')
+            key_elements_str = ', '.join(intent.get('key_elements') or ())
             
             prompt = f"""You are a video prompt generator. Your task is to convert the user's request into a clear video description for AI video generation.
 
@@ -66,7 +67,7 @@ Extracted intent:
 - Type: {intent.get('video_type', 'short video')}
 - Style: {intent.get('style', 'cinematic')}
 - Mood: {intent.get('mood', 'neutral')}
-- Key elements: {', '.join(intent.get('key_elements', []))}
+- Key elements: {key_elements_str}
 
 Generate a video prompt that:
 1. Matches the user's request exactly
@@ -76,16 +77,11 @@ Generate a video prompt that:
 
 Return ONLY the prompt text."""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
+            video_prompt = (await self.generate_text(prompt, cache=True)).strip()
             
-            if not response or not response.text:
+            if not video_prompt:
                 return self._fallback_prompt(intent)
             
-            video_prompt = response.text.strip()
-            
             await self.send_message(f"Prompt ready: {video_prompt[:50]}...")
             
             return {
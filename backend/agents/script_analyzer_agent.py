@@ -2,16 +2,20 @@
 Script Analyzer Agent - Analyzes user input and segments into scenes
 Detects if input describes a multi-scene story or single scene
 """
-from typing import Any, Dict, List
+from typing import Any, Dict
 import json
 
+from services.encoding import strip_json_fence
 from .base import BaseAgent
+from .intent_agent import complete_intent
 
 
 class ScriptAnalyzerAgent(BaseAgent):
     """
     Agent responsible for analyzing user input and segmenting into scenes.
     Detects narrative structure and splits into logical video segments.
+    Also extracts the video intent in the same LLM call, so the orchestrator
+    only needs IntentAgent when this agent is in fallback mode.
     """
     
     def __init__(self):
@@ -40,6 +44,7 @@ class ScriptAnalyzerAgent(BaseAgent):
             is_multi_scene: bool
             scenes: List[Dict] with scene details
             total_scenes: int
+            intent: dict with topic, style, mood, etc. (omitted in fallback mode)
         """
         text = input_data.get("text", "")
         intent = input_data.get("intent", {})
@@ -56,7 +61,7 @@ class ScriptAnalyzerAgent(BaseAgent):
         try:
             await self.update_progress(5, "Analyzing script structure...")
             
-            prompt = f"""Analyze this video request and determine if it describes multiple scenes or a single scene.
+            prompt = f"""Analyze this video request: extract its key elements and determine if it describes multiple scenes or a single scene.
 
 User request: "{description}"
 
@@ -70,6 +75,14 @@ If multi-scene, break it down into logical segments.
 
 Return JSON:
 {{
+    "intent": {{
+        "topic": "main subject of the video",
+        "video_type": "explainer, story, advertisement, tutorial, etc.",
+        "style": "cinematic, animated, documentary, etc.",
+        "mood": "exciting, calm, dramatic, etc.",
+        "duration": 8,
+        "key_elements": ["important", "visual", "elements"]
+    }},
     "is_multi_scene": true/false,
     "reasoning": "why you made this decision",
     "scenes": [
@@ -87,23 +100,15 @@ Return JSON:
 For single scene, return just one scene in the array.
 Return ONLY valid JSON."""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
+            # Parse response
+            result = await self.generate_text(
+                prompt, cache=True,
+                parse=lambda raw: json.loads(strip_json_fence(raw))
             )
             
-            if not response or not response.text:
+            if not result:
                 return self._fallback_analysis(description)
             
-            # Parse response
-            response_text = response.text.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-            
-            result = json.loads(response_text.strip())
-            
             scenes = result.get("scenes", [])
             is_multi_scene = result.get("is_multi_scene", False) and len(scenes) > 1
             
@@ -115,8 +120,11 @@ Return ONLY valid JSON."""
                 f"Detected {'multi-scene story' if is_multi_scene else 'single scene'}: {len(scenes)} scene(s)"
             )
             
+            intent = result.get("intent")
+            
             return {
                 "success": True,
+                "intent": complete_intent(intent, description) if isinstance(intent, dict) else None,
                 "is_multi_scene": is_multi_scene,
                 "scenes": scenes,
                 "total_scenes": len(scenes),
@@ -2,17 +2,38 @@
 Speech Agent - Handles audio transcription
 Converts voice input to text using Gemini
 """
-from typing import Any, Dict
-import base64
-import os
+from typing import Any, Dict, List, Optional, Union
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
 
+from google.genai import types
+
+from services.encoding import DATA_URL_RE, MAX_HEADER_LEN, decode_base64_chunked, strip_json_fence
 from .base import BaseAgent
 
+# Bound once at import instead of re-importing per request
+_Part = types.Part
+
+
+TRANSCRIBE_PROMPT = """Listen to this audio and transcribe exactly what the person is saying.
+If they are describing a video they want to create, capture all the details.
+Return ONLY the transcription, no additional commentary."""
+
+BATCH_TRANSCRIBE_PROMPT = """You will receive {count} separate audio clips, each preceded by its label ("Audio 1", "Audio 2", ...).
+Listen to each clip and transcribe exactly what the person is saying.
+If they are describing a video they want to create, capture all the details.
+Return ONLY a JSON array of {count} strings, the transcriptions in clip order, no additional commentary."""
+
 
 class SpeechAgent(BaseAgent):
     """
     Agent responsible for transcribing audio to text.
     Uses Gemini's multimodal capabilities for transcription.
+    
+    Requests arriving within batch_window seconds of each other are
+    coalesced into a single Gemini call (up to batch_max_size clips).
     """
     
     def __init__(self):
@@ -22,6 +43,13 @@ class SpeechAgent(BaseAgent):
         )
         self.client = None
         self._initialized = False
+        self.batch_max_size = 8
+        self.batch_window = 0.02
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # blake2b(audio bytes) -> transcription, LRU-evicted
+        self.cache_size = 512
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
     
     def initialize(self, client):
         """Initialize with Gemini client"""
@@ -33,7 +61,9 @@ class SpeechAgent(BaseAgent):
         Process audio data and return transcription.
         
         Input:
-            audio_data: Base64 encoded audio data
+            audio_data: Base64 encoded audio data (optionally a data URL)
+            audio_bytes: Raw audio bytes (multipart uploads), used instead of audio_data
+            mime_type: MIME type of audio_bytes (default audio/webm)
             
         Output:
             success: bool
@@ -41,48 +71,54 @@ class SpeechAgent(BaseAgent):
             error: str (if failed)
         """
         audio_data = input_data.get("audio_data")
+        audio_bytes = input_data.get("audio_bytes")
         
-        if not audio_data:
+        if not audio_data and not audio_bytes:
             return {"success": False, "error": "No audio data provided"}
         
         if not self._initialized or not self.client:
             return {"success": False, "error": "SpeechAgent not initialized"}
         
         try:
-            from google.genai import types
-            
             await self.update_progress(10, "Processing audio...")
             
-            # Extract base64 data
-            base64_data = audio_data
-            mime_type = "audio/webm"
-            
-            if "," in audio_data:
-                header, base64_data = audio_data.split(",", 1)
-                if "audio/" in header:
-                    mime_type = header.split(":")[1].split(";")[0]
+            mime_type = input_data.get("mime_type") or "audio/webm"
             
-            # Create inline data part
-            audio_part = types.Part.from_bytes(
-                data=base64.b64decode(base64_data),
-                mime_type=mime_type
-            )
+            if not audio_bytes:
+                # Extract base64 data (data URL header is skipped by offset, not split)
+                header_end = audio_data.find(",", 0, MAX_HEADER_LEN)
+                
+                if header_end >= 0:
+                    match = DATA_URL_RE.match(audio_data, 0, header_end)
+                    if match:
+                        mime_type = match.group(1)
+                
+                audio_bytes = decode_base64_chunked(audio_data, header_end + 1)
             
-            await self.update_progress(15, "Transcribing with AI...")
+            # Identical audio (retries, auto-resubmits) is answered from cache
+            cache_key = hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+            transcription = self._cache.get(cache_key)
             
-            # Use Gemini to transcribe
-            prompt = """Listen to this audio and transcribe exactly what the person is saying.
-If they are describing a video they want to create, capture all the details.
-Return ONLY the transcription, no additional commentary."""
-
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[prompt, audio_part]
-            )
+            if transcription is not None:
+                self._cache.move_to_end(cache_key)
+            else:
+                # Create inline data part
+                audio_part = _Part.from_bytes(
+                    data=audio_bytes,
+                    mime_type=mime_type
+                )
+                
+                await self.update_progress(15, "Transcribing with AI...")
+                
+                # Use Gemini to transcribe (batched with concurrent requests)
+                transcription = await self._submit(audio_part)
+                
+                if transcription:
+                    self._cache[cache_key] = transcription
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
             
-            # Extract text from response
-            if response and response.text:
-                transcription = response.text.strip()
+            if transcription:
                 await self.send_message(f"Transcribed: \"{transcription[:50]}...\"")
                 return {
                     "success": True,
@@ -99,6 +135,98 @@ Return ONLY the transcription, no additional commentary."""
                 "success": False,
                 "error": f"Transcription failed: {str(e)}"
             }
+    
+    async def _submit(self, audio_part) -> str:
+        """Queue an audio part for the batch worker and wait for its transcription"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batch_worker())
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((audio_part, future))
+        return await future
+    
+    async def _batch_worker(self):
+        """Drain the queue in micro-batches and transcribe each batch in one call"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            
+            while len(batch) < self.batch_max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                transcriptions = await asyncio.to_thread(self._transcribe_batch, [part for part, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), transcription in zip(batch, transcriptions):
+                if future.done():
+                    continue
+                if isinstance(transcription, Exception):
+                    future.set_exception(transcription)
+                else:
+                    future.set_result(transcription)
+    
+    def _transcribe_batch(self, audio_parts: List[Any]) -> List[Union[str, Exception]]:
+        """
+        Transcribe several clips with one request, one-by-one if the batch call
+        fails or its reply can't be split (per-clip failures are returned, not raised)
+        """
+        if len(audio_parts) == 1:
+            return [self._transcribe_one(audio_parts[0])]
+        
+        contents: List[Any] = [BATCH_TRANSCRIBE_PROMPT.format(count=len(audio_parts))]
+        for i, part in enumerate(audio_parts):
+            contents.extend([f"Audio {i + 1}:", part])
+        
+        try:
+            response = self.client.models.generate_content(
+                model="gemini-2.5-flash",
+                contents=contents
+            )
+        except Exception as e:
+            print(f"[SpeechAgent] Batch call failed ({e}), transcribing {len(audio_parts)} clips individually")
+            return self._transcribe_each(audio_parts)
+        
+        try:
+            transcriptions = json.loads(strip_json_fence(response.text or ""))
+        except ValueError:
+            transcriptions = None
+        
+        if not isinstance(transcriptions, list) or len(transcriptions) != len(audio_parts):
+            print(f"[SpeechAgent] Batch reply unusable, transcribing {len(audio_parts)} clips individually")
+            return self._transcribe_each(audio_parts)
+        
+        return [str(t).strip() for t in transcriptions]
+    
+    def _transcribe_each(self, audio_parts: List[Any]) -> List[Union[str, Exception]]:
+        """One request per clip, so one clip's failure doesn't fail the others"""
+        results: List[Union[str, Exception]] = []
+        for part in audio_parts:
+            try:
+                results.append(self._transcribe_one(part))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def _transcribe_one(self, audio_part) -> str:
+        response = self.client.models.generate_content(
+            model="gemini-2.5-flash",
+            contents=[TRANSCRIBE_PROMPT, audio_part]
+        )
+        return response.text.strip() if response and response.text else ""
 
 
 # Singleton instance
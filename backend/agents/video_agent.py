@@ -2,12 +2,132 @@
 Video Agent - Generates videos using Veo
 Handles the actual video generation process with retry support
 """
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from pathlib import Path
 import asyncio
+import hashlib
+import os
+import random
+import shutil
+
+import httpx
+from google.genai import types
 
 from .base import BaseAgent
 
+# Bound once at import instead of re-importing per request
+_GenerateVideosConfig = types.GenerateVideosConfig
+
+VEO_MODEL = "veo-2.0-generate-001"
+
+# Per-attempt limits: Veo operation wait, pause before a retry, video download
+MAX_WAIT = 300
+RETRY_DELAY = 5
+DOWNLOAD_TIMEOUT = 120
+
+
+class OperationPoller:
+    """
+    Polls all in-flight Veo operations from one background task.
+    Each operation backs off exponentially (with jitter) from initial_delay
+    to max_delay, so fast generations are picked up within about a second
+    instead of on the next fixed 10s tick. The blocking SDK call runs in a thread.
+    """
+    
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 30.0, backoff: float = 1.5):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        # operation name -> [client, operation, future, delay, next poll time]
+        self._pending: Dict[str, list] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    def wait(self, client, operation) -> asyncio.Future:
+        """Register an operation; the future resolves with it once done"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = operation.name or str(id(operation))
+        self._pending[key] = [client, operation, future, self.initial_delay, loop.time() + self.initial_delay]
+        future.add_done_callback(lambda f: self._discard(key, f))
+        
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._poll_loop())
+        else:
+            self._wakeup.set()
+        return future
+    
+    def _discard(self, key: str, future: asyncio.Future):
+        """Stop polling an operation as soon as its future is resolved or cancelled"""
+        entry = self._pending.get(key)
+        if entry is not None and entry[2] is future:
+            del self._pending[key]
+            self._wakeup.set()
+    
+    async def _poll_loop(self):
+        loop = asyncio.get_running_loop()
+        
+        while self._pending:
+            now = loop.time()
+            due = [(k, e) for k, e in self._pending.items() if e[4] <= now]
+            results = await asyncio.gather(
+                *[asyncio.to_thread(e[0].operations.get, e[1]) for _, e in due],
+                return_exceptions=True
+            )
+            
+            now = loop.time()
+            for (key, entry), result in zip(due, results):
+                future = entry[2]
+                if future.done():
+                    self._pending.pop(key, None)
+                elif isinstance(result, Exception):
+                    future.set_exception(result)
+                    self._pending.pop(key, None)
+                elif result.done:
+                    future.set_result(result)
+                    self._pending.pop(key, None)
+                else:
+                    entry[1] = result
+                    entry[3] = min(self.max_delay, entry[3] * self.backoff)
+                    entry[4] = now + entry[3] + random.uniform(0, entry[3] * 0.1)
+            
+            if not self._pending:
+                break
+            
+            self._wakeup.clear()
+            sleep_for = max(0.0, min(e[4] for e in self._pending.values()) - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Shared across all VideoAgent calls
+operation_poller = OperationPoller()
+
+# Bytes per read when streaming a finished video to disk
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Chunks gathered into one writev() call (one thread hop per batch)
+WRITE_BATCH_CHUNKS = 8
+
+
+def _write_chunks(f, chunks: List[bytes]):
+    """Write a batch of chunks to an unbuffered file with a single writev where available"""
+    if not hasattr(os, "writev"):
+        f.writelines(chunks)
+        return
+    
+    views = [memoryview(chunk) for chunk in chunks]
+    while views:
+        written = os.writev(f.fileno(), views)
+        # Handle short writes: drop fully written views, trim the partial one
+        while views and written >= len(views[0]):
+            written -= len(views[0])
+            views.pop(0)
+        if views and written:
+            views[0] = views[0][written:]
+
 
 class VideoAgent(BaseAgent):
     """
@@ -26,13 +146,42 @@ class VideoAgent(BaseAgent):
         self.output_dir = Path("generated/videos")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.max_retries = 2
+        self.http: Optional[httpx.AsyncClient] = None
+        # prompt hash -> future of the generation currently running for it
+        self._inflight: Dict[str, asyncio.Future] = {}
     
     def initialize(self, client, api_key: str):
         """Initialize with Gemini client and API key"""
         self.client = client
         self.api_key = api_key
+        if self.http is None:
+            # Pooled HTTP/2 connections, reused across downloads
+            self.http = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=DOWNLOAD_TIMEOUT,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=16)
+            )
         self._initialized = True
     
+    async def aclose(self):
+        """Close the pooled HTTP client (app shutdown)"""
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+    
+    async def warm_up(self):
+        """
+        Cheap Veo model lookup so DNS, TLS and auth are done (and the connection
+        pooled) before the first generate_videos call. Failures are only logged.
+        """
+        if not self._initialized or not self.client:
+            return
+        try:
+            await asyncio.to_thread(self.client.models.get, model=VEO_MODEL)
+        except Exception as e:
+            print(f"Veo warm-up failed: {e}")
+    
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process prompt and generate video with retry support.
@@ -59,12 +208,52 @@ class VideoAgent(BaseAgent):
         if not self._initialized or not self.client:
             return {"success": False, "error": "VideoAgent not initialized"}
         
+        # Identical prompts already generating share that Veo job
+        key = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+        shared = self._inflight.get(key)
+        if shared is not None:
+            await self.update_progress(60, "Waiting for identical video generation...")
+            result = await asyncio.shield(shared)
+            if not result.get("success"):
+                return result
+            return await asyncio.to_thread(self._link_video, result["video_path"], task_id)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._generate_with_retries(prompt, task_id)
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.set_result({"success": False, "error": "Shared video generation was cancelled"})
+            self._inflight.pop(key, None)
+    
+    def _link_video(self, source: str, task_id: str) -> Dict[str, Any]:
+        """Expose an already generated video under this task's filename"""
+        output_path = self.output_dir / f"{task_id}.mp4"
+        if output_path != Path(source):
+            try:
+                output_path.unlink(missing_ok=True)
+                os.link(source, output_path)
+            except OSError:
+                # Hard links unsupported (e.g. some filesystems) - fall back to a copy
+                shutil.copyfile(source, output_path)
+        
+        return {
+            "success": True,
+            "video_path": str(output_path),
+            "video_url": f"/api/video/file/{task_id}.mp4"
+        }
+    
+    async def _generate_with_retries(self, prompt: str, task_id: str) -> Dict[str, Any]:
+        """Generate a video, retrying failed attempts up to max_retries times"""
         # Try with retries
         last_error = None
         for attempt in range(self.max_retries + 1):
             if attempt > 0:
                 await self.update_progress(60, f"Retrying video generation (attempt {attempt + 1})...")
-                await asyncio.sleep(5)  # Brief pause before retry
+                await asyncio.sleep(RETRY_DELAY)  # Brief pause before retry
             
             result = await self._generate_video(prompt, task_id)
             
@@ -80,35 +269,43 @@ class VideoAgent(BaseAgent):
         """Internal method to generate a single video"""
         
         try:
-            from google.genai import types
-            
             await self.update_progress(60, "Starting video generation...")
             await self.send_message(f"Generating video with Veo 2...")
             
             # Start video generation with Veo 2
-            operation = self.client.models.generate_videos(
-                model="veo-2.0-generate-001",
+            operation = await asyncio.to_thread(
+                self.client.models.generate_videos,
+                model=VEO_MODEL,
                 prompt=prompt,
-                config=types.GenerateVideosConfig(
+                config=_GenerateVideosConfig(
                     person_generation="allow_adult",
                     aspect_ratio="16:9",
                     number_of_videos=1,
                 )
             )
             
-            # Wait for video generation to complete
-            max_wait = 300  # 5 minutes max
+            # Wait for video generation to complete (polled by the shared poller)
             wait_time = 0
             
-            while not operation.done and wait_time < max_wait:
-                await asyncio.sleep(10)
-                wait_time += 10
-                operation = self.client.operations.get(operation)
-                progress = min(90, 60 + int(wait_time / 300 * 30))
-                await self.update_progress(progress, f"Generating video... ({wait_time}s)")
-            
             if not operation.done:
-                return {"success": False, "error": "Video generation timed out"}
+                done_future = operation_poller.wait(self.client, operation)
+                
+                try:
+                    while not done_future.done() and wait_time < MAX_WAIT:
+                        await asyncio.wait({done_future}, timeout=10)
+                        wait_time += 10
+                        if not done_future.done():
+                            progress = min(90, 60 + int(wait_time / MAX_WAIT * 30))
+                            await self.update_progress(progress, f"Generating video... ({wait_time}s)")
+                    
+                    if not done_future.done():
+                        return {"success": False, "error": "Video generation timed out"}
+                    
+                    operation = done_future.result()
+                finally:
+                    # No-op once resolved; otherwise (timeout, progress handler error,
+                    # scene cancelled) the poller stops polling this operation
+                    done_future.cancel()
             
             # Get generated videos
             generated_videos = None
@@ -140,28 +337,34 @@ class VideoAgent(BaseAgent):
                 if hasattr(video_obj, 'uri') and video_obj.uri:
                     await self.update_progress(92, "Downloading video...")
                     
-                    import httpx
                     headers = {"x-goog-api-key": self.api_key}
                     
-                    async with httpx.AsyncClient(follow_redirects=True, timeout=120) as http_client:
-                        response = await http_client.get(video_obj.uri, headers=headers)
-                        
+                    async with self.http.stream("GET", video_obj.uri, headers=headers) as response:
                         if response.status_code == 200:
-                            with open(output_path, "wb") as f:
-                                f.write(response.content)
-                            
-                            await self.send_message("Video generated successfully!")
-                            
-                            return {
-                                "success": True,
-                                "video_path": str(output_path),
-                                "video_url": f"/api/video/file/{task_id}.mp4"
-                            }
-                        else:
-                            return {
-                                "success": False,
-                                "error": f"Failed to download video: HTTP {response.status_code}"
-                            }
+                            # Stream to disk in batches of chunks; writes run off the event loop
+                            with open(output_path, "wb", buffering=0) as f:
+                                batch = []
+                                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                                    batch.append(chunk)
+                                    if len(batch) >= WRITE_BATCH_CHUNKS:
+                                        await asyncio.to_thread(_write_chunks, f, batch)
+                                        batch = []
+                                if batch:
+                                    await asyncio.to_thread(_write_chunks, f, batch)
+                    
+                    if response.status_code == 200:
+                        await self.send_message("Video generated successfully!")
+                        
+                        return {
+                            "success": True,
+                            "video_path": str(output_path),
+                            "video_url": f"/api/video/file/{task_id}.mp4"
+                        }
+                    else:
+                        return {
+                            "success": False,
+                            "error": f"Failed to download video: HTTP {response.status_code}"
+                        }
                 
                 elif hasattr(video_obj, 'video_bytes') and video_obj.video_bytes:
                     with open(output_path, "wb") as f:
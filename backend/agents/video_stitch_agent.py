@@ -3,17 +3,37 @@ Video Stitch Agent - Concatenates multiple video clips into one
 Uses MoviePy with imageio-ffmpeg (bundled FFmpeg)
 Version: 1.1
 """
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
+import asyncio
+import json
+import os
 import shutil
+import subprocess
+import tempfile
+import threading
+
+import anyio
 
 from .base import BaseAgent
 
 
+# Encode jobs get their own thread slots so they can't starve the default pool
+_encode_limiter = anyio.CapacityLimiter(max(1, (os.cpu_count() or 1) // 2))
+
+# Hardware H.264 encoders in order of preference, with their extra FFmpeg params
+HW_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4", "-rc", "vbr"],
+    "h264_videotoolbox": [],
+    "h264_qsv": [],
+}
+
+
 class VideoStitchAgent(BaseAgent):
     """
     Agent responsible for stitching multiple video clips together.
-    Uses MoviePy which includes bundled FFmpeg via imageio-ffmpeg.
+    Tries an FFmpeg concat-demuxer stream copy first (no re-encode, since
+    Veo clips share codec/resolution/fps), then MoviePy re-encode.
     """
     
     def __init__(self):
@@ -24,6 +44,12 @@ class VideoStitchAgent(BaseAgent):
         self.output_dir = Path("generated/videos")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self._moviepy_available = self._check_moviepy()
+        self._ffmpeg_exe = self._find_ffmpeg()
+        # imageio-ffmpeg doesn't bundle ffprobe; use a system one if present
+        self._ffprobe_exe = shutil.which("ffprobe")
+        # (codec, ffmpeg params), detected on the first MoviePy encode
+        self._encoder: Optional[Tuple[str, List[str]]] = None
+        self._encoder_lock = threading.Lock()
         
         if self._moviepy_available:
             print("✓ MoviePy available for video stitching")
@@ -39,6 +65,54 @@ class VideoStitchAgent(BaseAgent):
             print(f"MoviePy import error: {e}")
             return False
     
+    def _find_ffmpeg(self) -> Optional[str]:
+        """Locate the FFmpeg binary bundled with imageio-ffmpeg"""
+        try:
+            from imageio_ffmpeg import get_ffmpeg_exe
+            return get_ffmpeg_exe()
+        except Exception as e:
+            print(f"FFmpeg lookup error: {e}")
+            return None
+    
+    def _get_encoder(self) -> Tuple[str, List[str]]:
+        """Cached encoder choice (blocking on first call; run from an encode thread)"""
+        with self._encoder_lock:
+            if self._encoder is None:
+                self._encoder = self._detect_encoder()
+            return self._encoder
+    
+    def _detect_encoder(self):
+        """Pick a working hardware H.264 encoder, falling back to libx264"""
+        if not self._ffmpeg_exe:
+            return "libx264", []
+        
+        try:
+            listed = subprocess.run(
+                [self._ffmpeg_exe, "-hide_banner", "-encoders"],
+                capture_output=True, text=True, timeout=10
+            ).stdout
+        except Exception as e:
+            print(f"FFmpeg encoder probe error: {e}")
+            return "libx264", []
+        
+        for codec, params in HW_ENCODERS.items():
+            if codec not in listed:
+                continue
+            # Listed encoders may still lack a device/driver - verify with a tiny encode
+            try:
+                test = subprocess.run(
+                    [self._ffmpeg_exe, "-v", "error", "-f", "lavfi", "-i", "color=s=256x256:d=0.1",
+                     "-pix_fmt", "yuv420p", "-c:v", codec, *params, "-f", "null", "-"],
+                    capture_output=True, timeout=15
+                )
+            except Exception:
+                continue
+            if test.returncode == 0:
+                print(f"✓ Hardware encoder available: {codec}")
+                return codec, ["-pix_fmt", "yuv420p", *params]
+        
+        return "libx264", []
+    
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Stitch multiple videos together.
@@ -78,80 +152,176 @@ class VideoStitchAgent(BaseAgent):
         
         await self.update_progress(92, f"Stitching {len(existing_paths)} video clips...")
         
-        # Use MoviePy if available
-        if self._moviepy_available:
-            result = await self._stitch_with_moviepy(existing_paths, output_path)
-        else:
-            result = await self._stitch_fallback(existing_paths, output_path)
+        # Stream copy first; re-encode with MoviePy only if the clips don't concat cleanly
+        result = {"success": False}
+        if self._ffmpeg_exe and await self._clips_compatible(existing_paths):
+            result = await self._stitch_with_concat(existing_paths, output_path)
+        
+        if not result.get("success"):
+            if self._moviepy_available:
+                result = await self._stitch_with_moviepy(existing_paths, output_path)
+            else:
+                result = await self._stitch_fallback(existing_paths, output_path)
         
         if result.get("success"):
             await self.send_message(f"✓ Successfully stitched {len(existing_paths)} clips!")
         
         return result
     
+    async def _probe_streams(self, path: str) -> Optional[Tuple]:
+        """Codec/resolution/frame-rate signature of a clip's streams via ffprobe"""
+        proc = await asyncio.create_subprocess_exec(
+            self._ffprobe_exe, "-v", "error", "-show_streams", "-of", "json", path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await proc.communicate()
+        if proc.returncode != 0:
+            return None
+        
+        streams = json.loads(stdout).get("streams", [])
+        return tuple(
+            (s.get("codec_type"), s.get("codec_name"), s.get("width"), s.get("height"),
+             s.get("r_frame_rate"), s.get("sample_rate"), s.get("channels"))
+            for s in streams
+        )
+    
+    async def _clips_compatible(self, video_paths: List[str]) -> bool:
+        """True if all clips can be stream-copied together (probed in parallel)"""
+        if not self._ffprobe_exe:
+            # Can't tell up front; a failed concat still falls back to MoviePy
+            return True
+        
+        signatures = await asyncio.gather(
+            *[self._probe_streams(path) for path in video_paths],
+            return_exceptions=True
+        )
+        if any(sig is None or isinstance(sig, Exception) for sig in signatures):
+            return False
+        
+        compatible = len(set(signatures)) == 1
+        if not compatible:
+            print("[VideoStitch] Clips differ in codec/resolution/fps, re-encoding with MoviePy")
+        return compatible
+    
+    async def _stitch_with_concat(
+        self, 
+        video_paths: List[str], 
+        output_path: Path
+    ) -> Dict[str, Any]:
+        """Stitch videos with the FFmpeg concat demuxer (-c copy, container rewrite only)"""
+        list_path = None
+        try:
+            with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+                list_path = f.name
+                for path in video_paths:
+                    escaped = str(Path(path).resolve()).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            
+            print(f"[VideoStitch] Concatenating {len(video_paths)} clips with FFmpeg stream copy...")
+            proc = await asyncio.create_subprocess_exec(
+                self._ffmpeg_exe, "-y", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-c", "copy", "-movflags", "+faststart", str(output_path),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await proc.communicate()
+            
+            if proc.returncode == 0 and output_path.exists() and output_path.stat().st_size > 0:
+                print(f"[VideoStitch] Successfully created: {output_path}")
+                return {
+                    "success": True,
+                    "output_path": str(output_path),
+                    "video_url": f"/api/video/file/{output_path.name}"
+                }
+            
+            print(f"[VideoStitch] FFmpeg concat failed ({proc.returncode}): {stderr.decode(errors='replace')[-500:]}")
+            return {"success": False, "error": "FFmpeg concat failed"}
+            
+        except Exception as e:
+            print(f"[VideoStitch] FFmpeg concat failed: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            if list_path:
+                Path(list_path).unlink(missing_ok=True)
+    
     async def _stitch_with_moviepy(
         self, 
         video_paths: List[str], 
         output_path: Path
     ) -> Dict[str, Any]:
         """Stitch videos using MoviePy"""
+        clips = []
+        final_clip = None
         try:
             from moviepy.editor import VideoFileClip, concatenate_videoclips
-            import asyncio
             
             print(f"[VideoStitch] Loading {len(video_paths)} clips with MoviePy...")
             
-            # Load all clips
-            clips = []
-            for i, path in enumerate(video_paths):
-                try:
-                    print(f"[VideoStitch] Loading clip {i+1}: {path}")
-                    clip = VideoFileClip(str(path))
+            # Load all clips concurrently (each probe spawns an ffmpeg subprocess),
+            # bounded so we don't start more probes than there are cores
+            load_limit = asyncio.Semaphore(os.cpu_count() or 1)
+            
+            async def load_clip(path: str):
+                async with load_limit:
+                    return await asyncio.to_thread(VideoFileClip, str(path))
+            
+            loaded = await asyncio.gather(
+                *[load_clip(path) for path in video_paths],
+                return_exceptions=True
+            )
+            
+            clip_paths = []
+            for i, (path, clip) in enumerate(zip(video_paths, loaded)):
+                if isinstance(clip, Exception):
+                    print(f"[VideoStitch] Failed to load clip {path}: {clip}")
+                else:
                     clips.append(clip)
+                    clip_paths.append(path)
                     print(f"[VideoStitch] Clip {i+1} loaded: {clip.duration}s, {clip.size}")
-                except Exception as e:
-                    print(f"[VideoStitch] Failed to load clip {path}: {e}")
             
             if not clips:
                 return {"success": False, "error": "No clips could be loaded"}
             
             if len(clips) == 1:
-                # Just one clip loaded successfully
-                print(f"[VideoStitch] Only one clip loaded, writing directly...")
-                
-                def write_single():
-                    clips[0].write_videofile(
-                        str(output_path), 
-                        codec="libx264", 
-                        audio_codec="aac",
-                        verbose=False,
-                        logger=None
-                    )
-                
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(None, write_single)
+                # Just one clip loaded successfully - it's already encoded, copy it
+                # (copyfile uses sendfile on Linux)
+                print(f"[VideoStitch] Only one clip loaded, copying directly...")
+                await asyncio.to_thread(shutil.copyfile, clip_paths[0], output_path)
             else:
                 # Concatenate all clips
                 print(f"[VideoStitch] Concatenating {len(clips)} clips...")
-                final_clip = concatenate_videoclips(clips, method="compose")
+                # "compose" blends onto a background canvas; only needed for mixed sizes
+                same_size = all(c.size == clips[0].size for c in clips)
+                final_clip = concatenate_videoclips(clips, method="chain" if same_size else "compose")
                 print(f"[VideoStitch] Final duration: {final_clip.duration}s")
                 
-                def write_final():
+                def write_final(video_codec: str, codec_params: List[str]):
                     final_clip.write_videofile(
                         str(output_path), 
-                        codec="libx264", 
+                        codec=video_codec, 
                         audio_codec="aac",
+                        ffmpeg_params=codec_params or None,
                         verbose=False,
                         logger=None
                     )
                 
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(None, write_final)
-                final_clip.close()
-            
-            # Clean up
-            for clip in clips:
-                clip.close()
+                def encode():
+                    video_codec, codec_params = self._get_encoder()
+                    try:
+                        write_final(video_codec, codec_params)
+                    except Exception as e:
+                        if video_codec == "libx264":
+                            raise
+                        # Hardware encoder passed the probe but failed on real input:
+                        # stop using it and redo this encode in software
+                        print(f"[VideoStitch] {video_codec} encode failed ({e}), retrying with libx264")
+                        with self._encoder_lock:
+                            self._encoder = ("libx264", [])
+                        write_final("libx264", [])
+                
+                await anyio.to_thread.run_sync(encode, limiter=_encode_limiter)
             
             if output_path.exists() and output_path.stat().st_size > 0:
                 print(f"[VideoStitch] Successfully created: {output_path}")
@@ -168,6 +338,12 @@ class VideoStitchAgent(BaseAgent):
             import traceback
             traceback.print_exc()
             return await self._stitch_fallback(video_paths, output_path)
+        finally:
+            # Clean up
+            if final_clip is not None:
+                final_clip.close()
+            for clip in clips:
+                clip.close()
     
     async def _stitch_fallback(
         self, 
@@ -0,0 +1,70 @@
+"""
+Response classes for serving generated video files
+"""
+from typing import Any, Dict, Optional
+import os
+
+import anyio
+from fastapi.responses import FileResponse, ORJSONResponse as _ORJSONResponse
+from starlette.types import Receive, Scope, Send
+
+from services.serialization import dumps
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """ORJSONResponse using the shared orjson options (UTC datetimes, extra types)"""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class VideoFileResponse(FileResponse):
+    """
+    FileResponse that lets the server send the file itself when it supports
+    an ASGI zero-copy extension (sendfile(2), no Python-level copy):
+    zerocopysend for full and single-range responses, pathsend for full ones.
+    Otherwise - and for multi-range requests - falls back to chunked reads
+    with a larger chunk size. Range parsing is left to Starlette.
+    """
+    
+    chunk_size = 1024 * 1024
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._extensions: Dict[str, Any] = scope.get("extensions") or {}
+        await super().__call__(scope, receive, send)
+    
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        
+        if "http.response.zerocopysend" in self._extensions:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await self._zerocopy_send(send)
+        elif "http.response.pathsend" in self._extensions:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+        else:
+            await super()._handle_simple(send, send_header_only)
+    
+    async def _handle_single_range(
+        self, send: Send, start: int, end: int, file_size: int, send_header_only: bool
+    ) -> None:
+        if send_header_only or "http.response.zerocopysend" not in self._extensions:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self._zerocopy_send(send, start, end - start)
+    
+    async def _zerocopy_send(self, send: Send, offset: int = 0, count: Optional[int] = None) -> None:
+        """Hand the open file to the server, which sendfile()s it to the socket"""
+        message: Dict[str, Any] = {"type": "http.response.zerocopysend", "more_body": False}
+        if offset:
+            message["offset"] = offset
+        if count is not None:
+            message["count"] = count
+        
+        with await anyio.to_thread.run_sync(open, self.path, "rb") as file:
+            message["file"] = file
+            await send(message)
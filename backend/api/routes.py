@@ -1,10 +1,11 @@
 """
 REST API Routes - Simple and direct
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from typing import List
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Response, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
+import re
 
 from models.schemas import (
     VideoRequest, 
@@ -15,15 +16,84 @@ from models.schemas import (
     ConversationRequest,
     ConversationResponse
 )
-from services.task_manager import task_manager
+from config import settings
+from services.serialization import dumps
+from services.encoding import sniff_audio_mime
+from services.task_manager import task_manager, Task
 from services.conversation_manager import conversation_manager, ConversationState
 from agents import orchestrator, clarification_agent, speech_agent
+from .responses import ORJSONResponse, VideoFileResponse
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Video files directory
 VIDEO_DIR = Path("generated/videos")
 
+# Allowed video filenames: <task_id>[_sceneN|_final].mp4 - rejects path separators,
+# "..", NUL and any other byte outside the allowlist in a single C-level match
+_is_video_filename = re.compile(r"[A-Za-z0-9_\-]{1,128}\.mp4").fullmatch
+
+# Upload read size (the total is capped by settings.MAX_UPLOAD_BYTES)
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _process_video_factory(
+    task_id: str,
+    *,
+    audio_data: Optional[str] = None,
+    text_input: Optional[str] = None,
+    audio_bytes: Optional[bytes] = None,
+    audio_mime_type: Optional[str] = None
+) -> Callable[[Callable], Awaitable[Dict[str, Any]]]:
+    """Build the task processor run by the task manager's worker pool"""
+    async def runner(on_status_update):
+        nonlocal audio_data, audio_bytes
+        orchestrator.set_status_handler(on_status_update)
+        pipeline = orchestrator.process_video_request(
+            task_id=task_id,
+            audio_data=audio_data,
+            text_input=text_input,
+            audio_bytes=audio_bytes,
+            audio_mime_type=audio_mime_type
+        )
+        # The pipeline holds the only reference now and drops it once transcribed
+        audio_data = audio_bytes = None
+        return await pipeline
+    return runner
+
+
+def _create_task(input_data: Dict[str, Any]) -> Task:
+    """task_manager.create_task, as a 503 when the store is full of unfinished tasks"""
+    task = task_manager.create_task(input_data)
+    if task is None:
+        raise HTTPException(status_code=503, detail="Too many tasks in progress, try again later")
+    return task
+
+
+async def _read_audio(audio: Optional[UploadFile]) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Bytes and MIME type of an uploaded audio file, read in chunks up to MAX_UPLOAD_BYTES (413 beyond).
+    A missing or non-audio content type is replaced by one sniffed from the file header.
+    """
+    if audio is None:
+        return None, None
+    
+    limit = settings.MAX_UPLOAD_BYTES
+    too_large = HTTPException(status_code=413, detail=f"Audio upload exceeds {limit} bytes")
+    if audio.size is not None and audio.size > limit:
+        raise too_large
+    
+    data = bytearray()
+    while chunk := await audio.read(_UPLOAD_CHUNK_SIZE):
+        data += chunk
+        if len(data) > limit:
+            raise too_large
+    
+    mime_type = (audio.content_type or "").split(";")[0].strip().lower()
+    if not mime_type.startswith("audio/"):
+        mime_type = sniff_audio_mime(data)
+    return bytes(data), mime_type
+
 
 @router.get("/health")
 async def health_check():
@@ -45,55 +115,103 @@ async def create_video(request: VideoRequest, background_tasks: BackgroundTasks)
         )
     
     # Create task
-    task = task_manager.create_task({
+    task = _create_task({
         "audio_data": request.audio_data,
         "text_input": request.text_input
     })
     
-    # Define the processor function
-    async def process_video(on_status_update):
-        orchestrator.set_status_handler(on_status_update)
-        return await orchestrator.process_video_request(
-            task_id=task.id,
-            audio_data=request.audio_data,
-            text_input=request.text_input
+    # Start processing in background
+    task_manager.start_task_async(task.id, _process_video_factory(
+        task.id,
+        audio_data=request.audio_data,
+        text_input=request.text_input
+    ))
+    
+    return TaskResponse(
+        task_id=task.id,
+        status=TaskStatus.PENDING,
+        message="Video generation task created. Use WebSocket or polling to track progress.",
+        created_at=task.created_at
+    )
+
+
+@router.post("/video/create/upload", response_model=TaskResponse)
+async def create_video_upload(
+    audio: Optional[UploadFile] = File(None),
+    text_input: Optional[str] = Form(None)
+):
+    """
+    Create a video generation task from a multipart upload.
+    Raw audio bytes skip the base64 round-trip of /video/create.
+    """
+    audio_bytes, audio_mime_type = await _read_audio(audio)
+    
+    if not audio_bytes and not text_input:
+        raise HTTPException(
+            status_code=400, 
+            detail="Either audio or text_input is required"
         )
     
-    # Start processing in background
-    task_manager.start_task_async(task.id, process_video)
+    task = _create_task({
+        "audio_filename": audio.filename if audio else None,
+        "text_input": text_input
+    })
+    
+    task_manager.start_task_async(task.id, _process_video_factory(
+        task.id,
+        text_input=text_input,
+        audio_bytes=audio_bytes,
+        audio_mime_type=audio_mime_type
+    ))
     
     return TaskResponse(
         task_id=task.id,
         status=TaskStatus.PENDING,
-        message="Video generation task created. Use WebSocket or polling to track progress."
+        message="Video generation task created. Use WebSocket or polling to track progress.",
+        created_at=task.created_at
     )
 
 
 @router.get("/video/status/{task_id}", response_model=TaskStatusResponse)
 async def get_task_status(task_id: str):
     """Get the status of a video generation task"""
-    task = task_manager.get_task(task_id)
+    task = await task_manager.fetch_task(task_id)
     
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return TaskStatusResponse(
-        task_id=task.id,
-        status=task.status,
-        phase=task.phase,
-        progress=task.progress,
-        message=task.message,
-        result=task.result,
-        error=task.error,
-        created_at=task.created_at,
-        updated_at=task.updated_at
-    )
+    # Polled frequently - skip TaskStatusResponse construction/validation
+    return ORJSONResponse(task.snapshot())
+
+
+async def _stream_tasks(tasks: List[Task]) -> AsyncIterator[bytes]:
+    """Emit a JSON array one task at a time instead of building it all up front"""
+    yield b"["
+    for i, task in enumerate(tasks):
+        yield (b"," if i else b"") + dumps(task.to_dict())
+    yield b"]"
 
 
 @router.get("/video/tasks", response_model=List[dict])
-async def list_tasks():
-    """List all tasks (for debugging)"""
-    return task_manager.get_all_tasks()
+async def list_tasks(cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1)):
+    """
+    List tasks (for debugging).
+    Paginate with ?limit=N; the X-Next-Cursor header is the ?cursor= for the next page.
+    """
+    if cursor is None and limit is None:
+        # Full listing: reuse the encoded snapshot until a task changes
+        return Response(task_manager.tasks_json(), media_type="application/json")
+    
+    tasks = task_manager.list_tasks(cursor, None if limit is None else limit + 1)
+    if tasks is None:
+        # Restarting from page 1 would hand a paginating client duplicates
+        raise HTTPException(status_code=410, detail="Cursor task no longer exists")
+    headers = {}
+    if limit is not None and len(tasks) > limit:
+        tasks = tasks[:limit]
+        headers["X-Next-Cursor"] = tasks[-1].id
+    
+    return StreamingResponse(_stream_tasks(tasks), media_type="application/json", headers=headers)
 
 
 @router.delete("/video/task/{task_id}")
@@ -104,7 +222,7 @@ async def delete_task(task_id: str):
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    del task_manager.tasks[task_id]
+    task_manager.delete_task(task_id)
     
     return {"message": f"Task {task_id} deleted"}
 
@@ -113,18 +231,31 @@ async def delete_task(task_id: str):
 async def get_video_file(filename: str):
     """Serve generated video files"""
     # Security: only allow mp4 files, prevent directory traversal
-    if not filename.endswith(".mp4") or "/" in filename or "\\" in filename:
+    if not _is_video_filename(filename):
         raise HTTPException(status_code=400, detail="Invalid filename")
     
     video_path = VIDEO_DIR / filename
     
-    if not video_path.exists():
+    try:
+        stat_result = video_path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    return FileResponse(
+    if settings.ENABLE_XACCEL:
+        # Nginx serves the bytes (sendfile, Range) from its internal location
+        return Response(
+            media_type="video/mp4",
+            headers={
+                "X-Accel-Redirect": f"{settings.XACCEL_PREFIX}{filename}",
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            }
+        )
+    
+    return VideoFileResponse(
         path=str(video_path),
         media_type="video/mp4",
-        filename=filename
+        filename=filename,
+        stat_result=stat_result
     )
 
 
@@ -136,18 +267,60 @@ async def send_message(request: ConversationRequest, background_tasks: Backgroun
     Send a message in a conversation.
     Supports multi-turn dialog with clarification.
     """
+    return await handle_conversation_message(request)
+
+
+@router.post("/conversation/message/upload", response_model=ConversationResponse)
+async def send_message_upload(
+    conversation_id: Optional[str] = Form(None),
+    message: Optional[str] = Form(None),
+    confirm_generate: bool = Form(False),
+    audio: Optional[UploadFile] = File(None)
+):
+    """
+    Send a conversation message as a multipart upload (raw audio instead of base64).
+    """
+    request = ConversationRequest(
+        conversation_id=conversation_id,
+        message=message,
+        confirm_generate=confirm_generate
+    )
+    audio_bytes, audio_mime_type = await _read_audio(audio)
+    return await handle_conversation_message(
+        request,
+        audio_bytes=audio_bytes,
+        audio_mime_type=audio_mime_type
+    )
+
+
+async def handle_conversation_message(
+    request: ConversationRequest,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    audio_bytes: Optional[bytes] = None,
+    audio_mime_type: Optional[str] = None
+) -> ConversationResponse:
+    """
+    Process one conversation turn. With on_token (conversation WebSocket),
+    the AI reply is streamed to it as it is generated. Audio comes either as
+    request.audio_data (base64) or as raw audio_bytes (multipart upload).
+    """
     # Get or create conversation
-    conversation = conversation_manager.get_or_create(request.conversation_id)
+    conversation = await conversation_manager.load_or_create(request.conversation_id)
     
     # Get user input
     user_text = request.message
     
     # If audio, transcribe first
-    if request.audio_data and not user_text:
-        result = await speech_agent.run({"audio_data": request.audio_data})
+    if (request.audio_data or audio_bytes) and not user_text:
+        result = await speech_agent.run({
+            "audio_data": request.audio_data,
+            "audio_bytes": audio_bytes,
+            "mime_type": audio_mime_type
+        })
         if result.get("success"):
             user_text = result.get("transcription", "")
         else:
+            await conversation_manager.save(conversation)
             return ConversationResponse(
                 conversation_id=conversation.id,
                 state=conversation.state.value,
@@ -170,7 +343,7 @@ async def send_message(request: ConversationRequest, background_tasks: Backgroun
         conversation.state = ConversationState.CONFIRMED
         
         # Create video task
-        task = task_manager.create_task({
+        task = _create_task({
             "text_input": conversation.accumulated_intent.get("original_input", user_text),
             "intent": conversation.accumulated_intent
         })
@@ -178,18 +351,15 @@ async def send_message(request: ConversationRequest, background_tasks: Backgroun
         conversation.state = ConversationState.GENERATING
         
         # Start video generation
-        async def process_video(on_status_update):
-            orchestrator.set_status_handler(on_status_update)
-            return await orchestrator.process_video_request(
-                task_id=task.id,
-                text_input=conversation.accumulated_intent.get("original_input", user_text)
-            )
-        
-        task_manager.start_task_async(task.id, process_video)
+        task_manager.start_task_async(task.id, _process_video_factory(
+            task.id,
+            text_input=conversation.accumulated_intent.get("original_input", user_text)
+        ))
         
         ai_response = "Great! I'm starting to generate your video now. This may take 1-2 minutes..."
         conversation.add_message("assistant", ai_response)
         
+        await conversation_manager.save(conversation)
         return ConversationResponse(
             conversation_id=conversation.id,
             state=conversation.state.value,
@@ -203,15 +373,25 @@ async def send_message(request: ConversationRequest, background_tasks: Backgroun
         )
     
     # Use ClarificationAgent to analyze
-    result = await clarification_agent.run({
+    clarification_input = {
         "text": user_text,
         "conversation_history": conversation.get_history(),
         "current_intent": conversation.accumulated_intent
-    })
+    }
+    if on_token is None:
+        result = await clarification_agent.run(clarification_input)
+    else:
+        result = {"success": False}
+        async for event in clarification_agent.run_stream(clarification_input):
+            if event["type"] == "token":
+                await on_token(event["delta"])
+            else:
+                result = event["result"]
     
     if not result.get("success"):
         ai_response = "I'm having trouble understanding. Could you please rephrase?"
         conversation.add_message("assistant", ai_response)
+        await conversation_manager.save(conversation)
         return ConversationResponse(
             conversation_id=conversation.id,
             state=conversation.state.value,
@@ -243,6 +423,7 @@ async def send_message(request: ConversationRequest, background_tasks: Backgroun
     if ai_response:
         conversation.add_message("assistant", ai_response)
     
+    await conversation_manager.save(conversation)
     return ConversationResponse(
         conversation_id=conversation.id,
         state=conversation.state.value,
@@ -258,16 +439,17 @@ async def send_message(request: ConversationRequest, background_tasks: Backgroun
 @router.get("/conversation/{conversation_id}")
 async def get_conversation(conversation_id: str):
     """Get conversation details"""
-    conversation = conversation_manager.get_conversation(conversation_id)
+    conversation = await conversation_manager.load(conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return conversation.to_dict()
+    # Returned directly so orjson encodes the datetimes (skips jsonable_encoder)
+    return ORJSONResponse(conversation.to_dict())
 
 
 @router.post("/conversation/{conversation_id}/generate")
 async def start_generation(conversation_id: str, background_tasks: BackgroundTasks):
     """Start video generation for a confirmed conversation"""
-    conversation = conversation_manager.get_conversation(conversation_id)
+    conversation = await conversation_manager.load(conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -275,7 +457,7 @@ async def start_generation(conversation_id: str, background_tasks: BackgroundTas
         raise HTTPException(status_code=400, detail="No video intent defined yet")
     
     # Create task
-    task = task_manager.create_task({
+    task = _create_task({
         "text_input": conversation.accumulated_intent.get("original_input", ""),
         "intent": conversation.accumulated_intent
     })
@@ -283,14 +465,11 @@ async def start_generation(conversation_id: str, background_tasks: BackgroundTas
     conversation.state = ConversationState.GENERATING
     
     # Start processing
-    async def process_video(on_status_update):
-        orchestrator.set_status_handler(on_status_update)
-        return await orchestrator.process_video_request(
-            task_id=task.id,
-            text_input=conversation.accumulated_intent.get("original_input", "")
-        )
-    
-    task_manager.start_task_async(task.id, process_video)
+    task_manager.start_task_async(task.id, _process_video_factory(
+        task.id,
+        text_input=conversation.accumulated_intent.get("original_input", "")
+    ))
+    await conversation_manager.save(conversation)
     
     return {
         "conversation_id": conversation.id,
@@ -302,10 +481,10 @@ async def start_generation(conversation_id: str, background_tasks: BackgroundTas
 @router.delete("/conversation/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation"""
-    conversation = conversation_manager.get_conversation(conversation_id)
+    conversation = await conversation_manager.load(conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    conversation_manager.delete_conversation(conversation_id)
+    await conversation_manager.remove(conversation_id)
     return {"message": f"Conversation {conversation_id} deleted"}
 
@@ -1,12 +1,77 @@
 """
 WebSocket endpoint for real-time updates
 """
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, Set
-import json
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
 import asyncio
 
+from models.schemas import ConversationRequest
+from services.conversation_manager import conversation_manager
+from services.serialization import dumps
 from services.task_manager import task_manager
+from .routes import handle_conversation_message
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Progress updates per task are coalesced to at most one send per window (latest wins)
+PROGRESS_DEBOUNCE_SECONDS = 0.1
+# Message types that skip the debounce and go out immediately
+TERMINAL_TYPES = {"complete", "error"}
+
+
+class SubscriberSender:
+    """
+    Delivers frames to one WebSocket from its own task, so a slow client
+    only delays itself. Progress frames keep only the newest unsent one
+    (stale 30%/40% updates are dropped); must-deliver frames (connected,
+    complete, error) queue in order and go out before any pending progress.
+    """
+    
+    def __init__(self, websocket: WebSocket, binary: bool = False):
+        self.websocket = websocket
+        # MessagePack binary frames (?fmt=msgpack) instead of JSON text frames
+        self.binary = binary
+        self._latest: Any = None
+        self._must_send: Deque[Any] = deque()
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+    
+    def send_latest(self, frame: Any):
+        """Queue a progress frame, replacing any not yet sent"""
+        self._latest = frame
+        self._ready.set()
+    
+    def send_always(self, frame: Any):
+        """Queue a frame that must not be dropped (supersedes pending progress)"""
+        self._latest = None
+        self._must_send.append(frame)
+        self._ready.set()
+    
+    def close(self):
+        self._task.cancel()
+    
+    async def _run(self):
+        send = self.websocket.send_bytes if self.binary else self.websocket.send_text
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._must_send or self._latest is not None:
+                    if self._must_send:
+                        frame = self._must_send.popleft()
+                    else:
+                        frame, self._latest = self._latest, None
+                    await send(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Dead socket - the endpoint's disconnect() cleans up
+            pass
 
 
 class ConnectionManager:
@@ -15,53 +80,115 @@ class ConnectionManager:
     def __init__(self):
         # task_id -> set of connections
         self.active_connections: Dict[str, Set[WebSocket]] = {}
+        # connection -> its sender
+        self.senders: Dict[WebSocket, SubscriberSender] = {}
+        # task_id -> the single task_manager subscription fanning out to its connections
+        self._subscriptions: Dict[str, Callable] = {}
+        # task_id -> latest debounced (data, encoded JSON) / scheduled flush
+        self._pending: Dict[str, Tuple[dict, Optional[bytes]]] = {}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
     
-    async def connect(self, websocket: WebSocket, task_id: str):
+    async def connect(self, websocket: WebSocket, task_id: str, fmt: str = "json"):
         """Accept connection and subscribe to task updates"""
         await websocket.accept()
         
+        sender = SubscriberSender(websocket, binary=fmt == "msgpack" and msgpack is not None)
+        self.senders[websocket] = sender
+        
         if task_id not in self.active_connections:
             self.active_connections[task_id] = set()
         self.active_connections[task_id].add(websocket)
         
-        # Subscribe to task updates
-        async def send_update(data: dict):
-            await self.send_to_task(task_id, data)
-        
-        task_manager.subscribe(task_id, send_update)
+        # Subscribe to task updates once per task; send_to_task reaches every connection
+        if task_id not in self._subscriptions:
+            async def send_update(data: dict, payload: bytes) -> bool:
+                await self.send_to_task(task_id, data, payload)
+                # False unsubscribes once no connection is left for the task
+                return task_id in self.active_connections
+            
+            self._subscriptions[task_id] = send_update
+            task_manager.subscribe(task_id, send_update, encoded=True)
         
         # Send current status immediately
         task = task_manager.get_task(task_id)
         if task:
-            await websocket.send_json({
-                "type": "connected",
-                "task_id": task_id,
-                **task.to_dict()
-            })
+            data = {"type": "connected", "task_id": task_id, **task.to_dict()}
+            sender.send_always(_packb(data) if sender.binary else dumps(data).decode())
     
     def disconnect(self, websocket: WebSocket, task_id: str):
         """Remove connection"""
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            sender.close()
         if task_id in self.active_connections:
             self.active_connections[task_id].discard(websocket)
             if not self.active_connections[task_id]:
                 del self.active_connections[task_id]
+                handler = self._subscriptions.pop(task_id, None)
+                if handler is not None:
+                    task_manager.unsubscribe(task_id, handler)
+                handle = self._flush_handles.pop(task_id, None)
+                if handle is not None:
+                    handle.cancel()
+                self._pending.pop(task_id, None)
     
-    async def send_to_task(self, task_id: str, data: dict):
-        """Send message to all connections watching a task"""
+    async def send_to_task(self, task_id: str, data: dict, payload: Optional[bytes] = None):
+        """
+        Send message to all connections watching a task.
+        `payload` is data already encoded as JSON, if the caller has it.
+        Progress updates are debounced; terminal messages go out immediately.
+        """
         if task_id not in self.active_connections:
             return
         
-        dead_connections = set()
-        
-        for connection in self.active_connections[task_id]:
-            try:
-                await connection.send_json(data)
-            except Exception:
-                dead_connections.add(connection)
+        if data.get("type") in TERMINAL_TYPES:
+            # Drop the superseded progress update
+            handle = self._flush_handles.pop(task_id, None)
+            if handle is not None:
+                handle.cancel()
+            self._pending.pop(task_id, None)
+            self._broadcast(task_id, data, payload, terminal=True)
+            return
         
-        # Clean up dead connections
-        for conn in dead_connections:
-            self.active_connections[task_id].discard(conn)
+        self._pending[task_id] = (data, payload)
+        if task_id not in self._flush_handles:
+            self._flush_handles[task_id] = asyncio.get_running_loop().call_later(
+                PROGRESS_DEBOUNCE_SECONDS, self._flush, task_id
+            )
+    
+    def _flush(self, task_id: str):
+        """Timer callback: send the latest pending update for a task"""
+        self._flush_handles.pop(task_id, None)
+        pending = self._pending.pop(task_id, None)
+        if pending is not None:
+            self._broadcast(task_id, *pending)
+    
+    def _broadcast(self, task_id: str, data: dict, payload: Optional[bytes] = None, terminal: bool = False):
+        """Encode once per format and hand the frame to every connection's sender"""
+        # JSON goes out as text frames, since the browser client JSON.parses event.data
+        text = binary = None
+        for connection in self.active_connections.get(task_id, ()):
+            sender = self.senders.get(connection)
+            if sender is None:
+                continue
+            if sender.binary:
+                if binary is None:
+                    binary = _packb(data)
+                frame = binary
+            else:
+                if text is None:
+                    text = (payload or dumps(data)).decode()
+                frame = text
+            
+            if terminal:
+                sender.send_always(frame)
+            else:
+                sender.send_latest(frame)
+
+
+def _packb(data: Dict[str, Any]) -> bytes:
+    """MessagePack-encode a payload (datetimes as timestamp extension values)"""
+    return msgpack.packb(data, use_bin_type=True, datetime=True)
 
 
 # Singleton connection manager
@@ -73,6 +200,7 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
     WebSocket endpoint for real-time task updates.
     
     Connect to: ws://localhost:8000/ws/{task_id}
+    Add ?fmt=msgpack to receive MessagePack binary frames instead of JSON text.
     
     Messages sent to client:
     - {"type": "connected", "task_id": "...", ...} - Initial connection
@@ -80,7 +208,7 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
     - {"type": "complete", "task_id": "...", "result": {...}}
     - {"type": "error", "task_id": "...", "error": "..."}
     """
-    await manager.connect(websocket, task_id)
+    await manager.connect(websocket, task_id, websocket.query_params.get("fmt", "json"))
     
     try:
         while True:
@@ -107,3 +235,63 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
     finally:
         manager.disconnect(websocket, task_id)
 
+
+async def conversation_websocket_endpoint(websocket: WebSocket, conversation_id: str):
+    """
+    WebSocket conversation endpoint with streamed AI replies.
+    
+    Connect to: ws://localhost:8000/ws/conv/{conversation_id}
+    (use "new" to start a conversation; the real id comes back in each response)
+    
+    Client sends ConversationRequest JSON: {"message": "...", "confirm_generate": false}
+    
+    Messages sent to client:
+    - {"type": "token", "conversation_id": "...", "delta": "..."} - AI reply text as it streams
+    - {"type": "response", ...ConversationResponse} - Final turn result (authoritative ai_response)
+    - {"type": "error", "error": "..."}
+    """
+    await websocket.accept()
+    
+    # The conversation this socket is bound to ("new" binds on the first message)
+    bound_id = None if conversation_id == "new" else conversation_id
+    
+    try:
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                await websocket.send_text("pong")
+                continue
+            
+            try:
+                request = ConversationRequest.model_validate_json(data)
+            except ValidationError as e:
+                await websocket.send_text(dumps({"type": "error", "error": str(e)}).decode())
+                continue
+            
+            if not request.conversation_id:
+                if bound_id is None:
+                    # Create it up front so the first turn's token frames carry the id too
+                    conversation = await conversation_manager.load_or_create(None)
+                    await conversation_manager.save(conversation)
+                    bound_id = conversation.id
+                request.conversation_id = bound_id
+            
+            async def send_token(delta: str):
+                await websocket.send_text(dumps({
+                    "type": "token",
+                    "conversation_id": request.conversation_id,
+                    "delta": delta
+                }).decode())
+            
+            try:
+                response = await handle_conversation_message(request, on_token=send_token)
+            except HTTPException as e:
+                await websocket.send_text(dumps({"type": "error", "error": e.detail}).decode())
+                continue
+            
+            # Follow the id actually used (an expired conversation is replaced by a new one)
+            bound_id = response.conversation_id
+            await websocket.send_text(dumps({"type": "response", **response.model_dump()}).decode())
+            
+    except WebSocketDisconnect:
+        pass
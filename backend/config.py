@@ -15,6 +15,10 @@ class Settings(BaseSettings):
     # API
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
+    # Uvicorn worker processes (ignored with DEBUG auto-reload). Only 1 is supported:
+    # workers share one listening socket (no stickiness) and task progress, task
+    # WebSockets and /video/tasks are per-process, so main.py runs a single worker
+    WORKERS: int = 1
     
     # CORS - Allow both common frontend ports
     CORS_ORIGINS: list[str] = ["http://localhost:3000", "http://localhost:3001"]
@@ -25,6 +29,39 @@ class Settings(BaseSettings):
     # Video Generation (for future use)
     RUNWAY_API_KEY: Optional[str] = None
     
+    # Largest audio file accepted by the multipart upload endpoints (413 beyond)
+    MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    
+    # Max video generations running at once (others wait their turn)
+    MAX_CONCURRENT_GENERATIONS: int = 4
+    
+    # Tasks kept in memory (oldest finished evicted first; new tasks get 503 when all are
+    # unfinished) and how long finished ones are kept
+    MAX_TASKS: int = 1000
+    TASK_TTL_SECONDS: int = 3600
+    
+    # SQLite file tasks are written behind to (needs aiosqlite; memory-only without it or if empty)
+    TASK_DB_PATH: Optional[str] = "generated/tasks.sqlite3"
+    
+    # Conversations kept in memory (least recently used evicted) and idle lifetime
+    MAX_CONVERSATIONS: int = 1000
+    CONVERSATION_TTL_SECONDS: int = 3600
+    # Messages kept per conversation (oldest dropped first)
+    MAX_MESSAGES_PER_CONV: int = 100
+    
+    # Exact-match cache of agent (intent/script/prompt) Gemini replies on disk
+    # (needs aiosqlite; memory-only without it)
+    LLM_CACHE_PATH: str = "generated/llm_cache.sqlite3"
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    
+    # Store conversations in Redis instead (shared across workers), e.g. redis://localhost:6379/0
+    REDIS_URL: Optional[str] = None
+    
+    # Video files - hand downloads to Nginx via X-Accel-Redirect (production only;
+    # needs an `internal` location at XACCEL_PREFIX aliased to generated/videos/)
+    ENABLE_XACCEL: bool = False
+    XACCEL_PREFIX: str = "/_protected_videos/"
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
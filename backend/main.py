@@ -2,25 +2,63 @@
 KIWI-Video Backend API
 Simple FastAPI application for video generation from voice
 """
+from contextlib import asynccontextmanager, suppress
+from importlib.util import find_spec
+import asyncio
+
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from config import settings
+from api.responses import ORJSONResponse
 from api.routes import router
-from api.websocket import websocket_endpoint
-from agents import orchestrator
+from api.websocket import websocket_endpoint, conversation_websocket_endpoint
+from agents import orchestrator, video_agent
+from services.conversation_manager import conversation_manager
+from services.gemini_service import gemini_service
+from services.llm_cache import llm_cache
+from services.task_manager import task_manager
+
+# uvloop/httptools ship with uvicorn[standard] but not on every platform (e.g. Windows)
+LOOP = "uvloop" if find_spec("uvloop") else "asyncio"
+HTTP = "httptools" if find_spec("httptools") else "h11"
 
 # Initialize orchestrator with all agents
 orchestrator.initialize(settings.GEMINI_API_KEY)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """App startup/shutdown hooks"""
+    await task_manager.open()
+    background = [
+        asyncio.create_task(conversation_manager.run_sweeper()),
+        asyncio.create_task(task_manager.run_sweeper()),
+        asyncio.create_task(task_manager.run_persister())
+    ]
+    yield
+    for job in background:
+        job.cancel()
+        with suppress(asyncio.CancelledError):
+            await job
+    await task_manager.aclose()
+    # Release pooled connections
+    await video_agent.aclose()
+    await gemini_service.aclose()
+    await conversation_manager.aclose()
+    await llm_cache.aclose()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     description="Voice to Video Generation API",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware - Allow all origins in development
@@ -41,6 +79,11 @@ async def ws_endpoint(websocket: WebSocket, task_id: str):
     """WebSocket endpoint for real-time task updates"""
     await websocket_endpoint(websocket, task_id)
 
+@app.websocket("/ws/conv/{conversation_id}")
+async def ws_conversation_endpoint(websocket: WebSocket, conversation_id: str):
+    """WebSocket endpoint for conversations with streamed replies"""
+    await conversation_websocket_endpoint(websocket, conversation_id)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -53,10 +96,17 @@ async def root():
 
 
 if __name__ == "__main__":
+    if settings.WORKERS > 1 and not settings.DEBUG:
+        # No shared task backend: other workers' tasks would be invisible to clients
+        print(f"Warning: WORKERS={settings.WORKERS} is unsupported for task tracking; running 1 worker")
     uvicorn.run(
         "main:app",
         host=settings.API_HOST,
         port=settings.API_PORT,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        workers=None if settings.DEBUG else 1,
+        loop=LOOP,
+        http=HTTP,
+        ws="websockets"
     )
 
@@ -4,7 +4,7 @@ Pydantic schemas for API requests and responses
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
 
 
@@ -28,7 +28,11 @@ class TaskPhase(str, Enum):
 
 class VideoRequest(BaseModel):
     """Request to create a video from voice/text"""
-    audio_data: Optional[str] = Field(None, description="Base64 encoded audio data")
+    audio_data: Optional[str] = Field(
+        None,
+        description="Base64 encoded audio data (deprecated: use /video/create/upload)",
+        json_schema_extra={"deprecated": True}
+    )
     text_input: Optional[str] = Field(None, description="Text input if no audio")
     
     class Config:
@@ -46,7 +50,7 @@ class TaskResponse(BaseModel):
     task_id: str = Field(..., description="Unique task identifier")
     status: TaskStatus = Field(..., description="Current task status")
     message: str = Field(..., description="Status message")
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
 class TaskStatusResponse(BaseModel):
@@ -67,7 +71,7 @@ class AgentMessage(BaseModel):
     agent_name: str
     message: str
     data: Optional[Dict[str, Any]] = None
-    timestamp: datetime = Field(default_factory=datetime.now)
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
 # ============== WebSocket Schemas ==============
@@ -105,7 +109,11 @@ class ConversationRequest(BaseModel):
     """Request to send a message in conversation"""
     conversation_id: Optional[str] = Field(None, description="Existing conversation ID")
     message: Optional[str] = Field(None, description="Text message")
-    audio_data: Optional[str] = Field(None, description="Base64 encoded audio")
+    audio_data: Optional[str] = Field(
+        None,
+        description="Base64 encoded audio (deprecated: use /conversation/message/upload)",
+        json_schema_extra={"deprecated": True}
+    )
     confirm_generate: bool = Field(False, description="User confirms to start generation")
 
 
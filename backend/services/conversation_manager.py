@@ -2,11 +2,28 @@
 Conversation Manager - Manages multi-turn dialog state
 Stores conversation history and accumulated intent
 """
-from typing import Dict, Any, List, Optional
-from datetime import datetime
+from typing import Deque, Dict, Any, List, Optional
+from collections import OrderedDict, deque
+from itertools import islice
+from datetime import datetime, timedelta, timezone
 from enum import Enum
+import asyncio
+import secrets
+import time
 import uuid
 
+import orjson
+
+from config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# Messages kept per conversation (get_history only returns the last 20)
+MAX_MESSAGES = settings.MAX_MESSAGES_PER_CONV
+
 
 class ConversationState(str, Enum):
     """Conversation states"""
@@ -22,19 +39,29 @@ class Message:
     """Single message in conversation"""
     
     def __init__(self, role: str, content: str, msg_type: str = "text"):
-        self.id = str(uuid.uuid4())
+        # Only needs to be unique within its conversation; cheaper than a UUID
+        self.id = secrets.token_hex(8)
         self.role = role  # "user" or "assistant"
         self.content = content
         self.msg_type = msg_type  # "text", "audio", "video"
-        self.timestamp = datetime.now()
+        self.timestamp = time.time()  # epoch seconds; converted only in to_dict
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        """Rebuild a message serialized with to_dict (Redis store)"""
+        message = cls(data["role"], data["content"], data.get("type", "text"))
+        message.id = data["id"]
+        message.timestamp = datetime.fromisoformat(data["timestamp"]).timestamp()
+        return message
     
     def to_dict(self) -> Dict[str, Any]:
+        # datetimes are left as-is; orjson serializes them natively
         return {
             "id": self.id,
             "role": self.role,
             "content": self.content,
             "type": self.msg_type,
-            "timestamp": self.timestamp.isoformat()
+            "timestamp": datetime.fromtimestamp(self.timestamp, tz=timezone.utc)
         }
 
 
@@ -44,18 +71,21 @@ class Conversation:
     def __init__(self, conversation_id: str):
         self.id = conversation_id
         self.state = ConversationState.ACTIVE
-        self.messages: List[Message] = []
+        self.messages: Deque[Message] = deque(maxlen=MAX_MESSAGES)  # oldest dropped on append
         self.accumulated_intent: Dict[str, Any] = {}
         self.pending_questions: List[str] = []
         self.task_id: Optional[str] = None  # Associated video task
-        self.created_at = datetime.now()
-        self.updated_at = datetime.now()
+        self.created_at = datetime.now(timezone.utc)
+        self.updated_at = datetime.now(timezone.utc)
+        # Messages added since the last save (appended to the Redis list)
+        self.unsaved_messages: List[Message] = []
     
     def add_message(self, role: str, content: str, msg_type: str = "text") -> Message:
         """Add a message to the conversation"""
         message = Message(role, content, msg_type)
         self.messages.append(message)
-        self.updated_at = datetime.now()
+        self.unsaved_messages.append(message)
+        self.updated_at = datetime.now(timezone.utc)
         return message
     
     def update_intent(self, intent: Dict[str, Any]):
@@ -63,11 +93,12 @@ class Conversation:
         for key, value in intent.items():
             if value is not None:
                 self.accumulated_intent[key] = value
-        self.updated_at = datetime.now()
+        self.updated_at = datetime.now(timezone.utc)
     
     def get_history(self, limit: int = 20) -> List[Dict[str, Any]]:
         """Get message history"""
-        return [msg.to_dict() for msg in self.messages[-limit:]]
+        start = max(0, len(self.messages) - limit)
+        return [msg.to_dict() for msg in islice(self.messages, start, None)]
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -77,50 +108,76 @@ class Conversation:
             "accumulated_intent": self.accumulated_intent,
             "pending_questions": self.pending_questions,
             "task_id": self.task_id,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat()
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
         }
 
 
 class ConversationManager:
     """
     Manages all conversation sessions.
-    In-memory storage (can be extended to Redis/DB).
+    In-memory storage (can be extended to Redis/DB), bounded as an LRU of
+    max_conversations; conversations idle longer than ttl are swept periodically.
     """
     
     def __init__(self):
-        self.conversations: Dict[str, Conversation] = {}
+        self.conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.max_conversations = settings.MAX_CONVERSATIONS
+        self.ttl = timedelta(seconds=settings.CONVERSATION_TTL_SECONDS)
     
     def create_conversation(self) -> Conversation:
         """Create a new conversation"""
         conversation_id = str(uuid.uuid4())
         conversation = Conversation(conversation_id)
         self.conversations[conversation_id] = conversation
+        if len(self.conversations) > self.max_conversations:
+            self.conversations.popitem(last=False)
         return conversation
     
     def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
         """Get conversation by ID"""
-        return self.conversations.get(conversation_id)
+        conversation = self.conversations.get(conversation_id)
+        if conversation:
+            self.conversations.move_to_end(conversation_id)
+        return conversation
     
     def get_or_create(self, conversation_id: Optional[str] = None) -> Conversation:
         """Get existing or create new conversation"""
-        if conversation_id and conversation_id in self.conversations:
-            return self.conversations[conversation_id]
+        if conversation_id:
+            conversation = self.get_conversation(conversation_id)
+            if conversation:
+                return conversation
         return self.create_conversation()
     
+    def sweep(self) -> int:
+        """Drop conversations idle longer than the TTL; returns how many were removed"""
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        expired = [cid for cid, conv in self.conversations.items() if conv.updated_at < cutoff]
+        for cid in expired:
+            del self.conversations[cid]
+        return len(expired)
+    
+    async def run_sweeper(self, interval: float = 60):
+        """Background loop calling sweep() every `interval` seconds (started in app lifespan)"""
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                print(f"[ConversationManager] Swept {removed} idle conversations")
+    
     def update_state(self, conversation_id: str, state: ConversationState):
         """Update conversation state"""
         conv = self.get_conversation(conversation_id)
         if conv:
             conv.state = state
-            conv.updated_at = datetime.now()
+            conv.updated_at = datetime.now(timezone.utc)
     
     def set_task_id(self, conversation_id: str, task_id: str):
         """Associate a task with conversation"""
         conv = self.get_conversation(conversation_id)
         if conv:
             conv.task_id = task_id
-            conv.updated_at = datetime.now()
+            conv.updated_at = datetime.now(timezone.utc)
     
     def delete_conversation(self, conversation_id: str):
         """Delete a conversation"""
@@ -130,8 +187,101 @@ class ConversationManager:
     def get_all_conversations(self) -> List[Dict[str, Any]]:
         """Get all conversations"""
         return [conv.to_dict() for conv in self.conversations.values()]
+    
+    # Async API used by the routes; the in-memory store needs no I/O
+    
+    async def load(self, conversation_id: str) -> Optional[Conversation]:
+        return self.get_conversation(conversation_id)
+    
+    async def load_or_create(self, conversation_id: Optional[str] = None) -> Conversation:
+        return self.get_or_create(conversation_id)
+    
+    async def save(self, conversation: Conversation):
+        conversation.unsaved_messages.clear()
+    
+    async def remove(self, conversation_id: str):
+        self.delete_conversation(conversation_id)
+    
+    async def aclose(self):
+        pass
+
+
+class RedisConversationManager(ConversationManager):
+    """
+    Conversation store shared by all workers, kept in Redis:
+        conv:{id}         hash  - state, task_id, pending_questions, timestamps
+        conv:{id}:intent  hash  - accumulated intent, one orjson value per key
+        conv:{id}:msgs    list  - orjson messages, capped to the last MAX_MESSAGES
+    All keys expire after the conversation TTL, so no sweeper is needed.
+    """
+    
+    def __init__(self, url: str):
+        super().__init__()
+        if aioredis is None:
+            raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+        self.redis = aioredis.from_url(url)
+        self.ttl_seconds = settings.CONVERSATION_TTL_SECONDS
+    
+    async def load(self, conversation_id: str) -> Optional[Conversation]:
+        key = f"conv:{conversation_id}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.hgetall(f"{key}:intent")
+            pipe.lrange(f"{key}:msgs", 0, -1)
+            fields, intent, messages = await pipe.execute()
+        
+        if not fields:
+            return None
+        
+        conversation = Conversation(conversation_id)
+        conversation.state = ConversationState(fields[b"state"].decode())
+        conversation.task_id = fields[b"task_id"].decode() or None
+        conversation.pending_questions = orjson.loads(fields[b"pending_questions"])
+        conversation.created_at = datetime.fromisoformat(fields[b"created_at"].decode())
+        conversation.updated_at = datetime.fromisoformat(fields[b"updated_at"].decode())
+        conversation.accumulated_intent = {k.decode(): orjson.loads(v) for k, v in intent.items()}
+        conversation.messages.extend(Message.from_dict(orjson.loads(m)) for m in messages)
+        return conversation
+    
+    async def load_or_create(self, conversation_id: Optional[str] = None) -> Conversation:
+        if conversation_id:
+            conversation = await self.load(conversation_id)
+            if conversation:
+                return conversation
+        return Conversation(str(uuid.uuid4()))
+    
+    async def save(self, conversation: Conversation):
+        key = f"conv:{conversation.id}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={
+                "state": conversation.state.value,
+                "task_id": conversation.task_id or "",
+                "pending_questions": orjson.dumps(conversation.pending_questions),
+                "created_at": conversation.created_at.isoformat(),
+                "updated_at": conversation.updated_at.isoformat()
+            })
+            if conversation.accumulated_intent:
+                pipe.hset(f"{key}:intent", mapping={
+                    k: orjson.dumps(v) for k, v in conversation.accumulated_intent.items()
+                })
+            if conversation.unsaved_messages:
+                pipe.rpush(f"{key}:msgs", *[orjson.dumps(m.to_dict()) for m in conversation.unsaved_messages])
+                pipe.ltrim(f"{key}:msgs", -MAX_MESSAGES, -1)
+            for k in (key, f"{key}:intent", f"{key}:msgs"):
+                pipe.expire(k, self.ttl_seconds)
+            await pipe.execute()
+        conversation.unsaved_messages.clear()
+    
+    async def remove(self, conversation_id: str):
+        key = f"conv:{conversation_id}"
+        await self.redis.delete(key, f"{key}:intent", f"{key}:msgs")
+    
+    async def aclose(self):
+        await self.redis.aclose()
 
 
-# Singleton instance
-conversation_manager = ConversationManager()
+# Singleton instance (Redis-backed when REDIS_URL is configured, e.g. multiple workers)
+conversation_manager = (
+    RedisConversationManager(settings.REDIS_URL) if settings.REDIS_URL else ConversationManager()
+)
 
@@ -0,0 +1,65 @@
+"""
+Encoding helpers shared by the agents and services - data URL audio payloads
+and JSON embedded in model replies
+"""
+import base64
+import binascii
+import re
+
+# Base64 characters decoded per step (a multiple of 4 so chunks align to quanta)
+B64_CHUNK_SIZE = 64 * 1024
+
+# Data URL header ("data:audio/webm;codecs=opus;base64,") is searched only within this prefix
+MAX_HEADER_LEN = 128
+DATA_URL_RE = re.compile(r"data:(audio/[^;,]+)")
+
+# Leading magic bytes of the audio containers browsers and recorders upload
+_AUDIO_MAGIC = (
+    (b"\x1a\x45\xdf\xa3", "audio/webm"),
+    (b"OggS", "audio/ogg"),
+    (b"fLaC", "audio/flac"),
+    (b"ID3", "audio/mpeg"),
+    (b"\xff\xfb", "audio/mpeg"),
+    (b"\xff\xf3", "audio/mpeg"),
+    (b"\xff\xf2", "audio/mpeg"),
+)
+
+# Matches a ```json ... ``` (or bare ```) fenced block in LLM output
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+
+def decode_base64_chunked(data: str, start: int = 0) -> bytes:
+    """
+    Decode data[start:] in fixed-size chunks into one preallocated buffer,
+    instead of slicing off a full copy of the (multi-MB) base64 text first.
+    """
+    out = bytearray((len(data) - start) * 3 // 4)
+    n = 0
+    try:
+        for pos in range(start, len(data), B64_CHUNK_SIZE):
+            chunk = binascii.a2b_base64(data[pos:pos + B64_CHUNK_SIZE])
+            out[n:n + len(chunk)] = chunk
+            n += len(chunk)
+    except binascii.Error:
+        # Embedded whitespace breaks chunk alignment - decode in one go
+        return base64.b64decode(data[start:])
+    del out[n:]
+    return bytes(out)
+
+
+def strip_json_fence(text: str) -> str:
+    """Return the contents of the first markdown code fence, or the text itself"""
+    match = _JSON_FENCE_RE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def sniff_audio_mime(data: bytes, default: str = "audio/webm") -> str:
+    """Audio MIME type from the leading bytes of a file (default if unrecognised)"""
+    for magic, mime_type in _AUDIO_MAGIC:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "audio/wav"
+    if data[4:8] == b"ftyp":
+        return "audio/mp4"
+    return default
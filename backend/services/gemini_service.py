@@ -5,12 +5,67 @@ Supports text, audio understanding, and Veo video generation
 import os
 import time
 import asyncio
-import base64
+import random
 import tempfile
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
 from pathlib import Path
 
+import httpx
+import orjson
+
 from config import settings
+from models.schemas import VideoIntent
+from .encoding import DATA_URL_RE, MAX_HEADER_LEN, decode_base64_chunked, strip_json_fence
+
+TEXT_MODEL = "gemini-2.5-flash"
+
+# Bytes per read when streaming a finished video to disk
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Static instructions come first and the per-request fields last, so repeated calls
+# share a byte-identical prefix that Gemini's implicit prompt cache can reuse
+UNDERSTAND_INTENT_PREAMBLE = """Analyze the video creation request below and extract the key elements.
+
+Return a JSON object with these fields:
+- topic: main subject of the video
+- video_type: type (explainer, story, advertisement, tutorial, etc.)
+- style: visual style (cinematic, animated, documentary, etc.)
+- mood: emotional tone (exciting, calm, dramatic, etc.)
+- duration: suggested duration in seconds (default 8 for Veo)
+- key_elements: list of important visual elements to include
+
+Return ONLY valid JSON, no markdown formatting."""
+
+VIDEO_PROMPT_PREAMBLE = """You are a video prompt generator. Your task is to convert the user's request below into a clear video description for AI video generation.
+
+CRITICAL RULES:
+1. You MUST stay faithful to what the user actually requested
+2. Do NOT add unrelated content or change the subject
+3. If the user's request is vague (like "yeah" or "okay"), just describe a simple, neutral scene
+4. Add visual details (camera angle, lighting) but keep the SUBJECT the same as what user requested
+
+Generate a video prompt that:
+1. Matches the user's request exactly
+2. Adds appropriate visual details (camera movement, lighting)
+3. Is 1-3 sentences long
+4. Does NOT invent new subjects or stories
+
+Return ONLY the prompt text."""
+
+
+# Constant fields of the no-API fallback intent
+_FALLBACK_TEMPLATE = {
+    "video_type": "short video",
+    "style": "cinematic",
+    "mood": "engaging",
+    "duration": 8
+}
+
+
+@lru_cache(maxsize=256)
+def _format_fallback_prompt(topic: str, style: str, mood: str) -> str:
+    return f"A {style} video showing {topic}, {mood} atmosphere, high quality, 4K, smooth camera movement"
 
 
 class GeminiService:
@@ -25,6 +80,7 @@ class GeminiService:
         self.client = None
         self.output_dir = Path("generated/videos")
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.http: Optional[httpx.AsyncClient] = None
     
     def initialize(self):
         """Initialize the Gemini client"""
@@ -37,8 +93,23 @@ class GeminiService:
         
         try:
             from google import genai
+            from google.genai import types
             
-            self.client = genai.Client(api_key=self.api_key)
+            # Async calls go through client.aio on an httpx transport (doesn't block the loop)
+            self.client = genai.Client(
+                api_key=self.api_key,
+                http_options=types.HttpOptions(
+                    async_client_args={"transport": httpx.AsyncHTTPTransport()}
+                )
+            )
+            if self.http is None:
+                # Pooled HTTP/2 connections, reused across video downloads
+                self.http = httpx.AsyncClient(
+                    http2=True,
+                    follow_redirects=True,
+                    timeout=120,
+                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+                )
             self._initialized = True
             print("Gemini service initialized successfully")
             
@@ -46,31 +117,78 @@ class GeminiService:
             print(f"Gemini initialization failed: {e}")
             self._initialized = False
     
-    async def transcribe_audio(self, audio_base64: str) -> str:
+    async def aclose(self):
+        """Close the pooled HTTP client (app shutdown)"""
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+    
+    async def transcribe_audio(
+        self,
+        audio_base64: Optional[str] = None,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+        *,
+        audio_bytes: Optional[bytes] = None,
+        mime_type: Optional[str] = None
+    ) -> str:
         """
         Transcribe audio to text using Gemini's multimodal capabilities.
-        Uses inline data for simplicity.
+        Consumes transcribe_audio_stream; on_partial gets the text so far after each chunk.
+        """
+        parts = []
+        try:
+            async for delta in self.transcribe_audio_stream(audio_base64, audio_bytes=audio_bytes, mime_type=mime_type):
+                parts.append(delta)
+                if on_partial:
+                    await on_partial("".join(parts))
+        except Exception as e:
+            # Stream cut off mid-way: a partial transcript must not drive generation
+            print(f"Audio transcription failed: {e}")
+            return ""
+        
+        transcription = "".join(parts).strip()
+        if transcription:
+            print(f"Audio transcribed: {transcription[:100]}...")
+        else:
+            print("No text in response")
+        return transcription
+    
+    async def transcribe_audio_stream(
+        self,
+        audio_base64: Optional[str] = None,
+        *,
+        audio_bytes: Optional[bytes] = None,
+        mime_type: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the transcription of audio as text chunks arrive from Gemini.
+        Takes base64 audio (optionally a data URL) or raw audio_bytes (skips decoding).
+        Uses inline data for simplicity. Yields nothing if transcription fails before
+        any text arrives; re-raises if it fails after, so callers can drop the partial text.
         """
         if not self._initialized or not self.client:
             print("Gemini not initialized, cannot transcribe audio")
-            return ""
+            return
         
+        parts = []
         try:
             from google.genai import types
             
-            # Extract mime type and base64 data
-            mime_type = "audio/webm"
-            base64_data = audio_base64
-            
-            if "," in audio_base64:
-                header, base64_data = audio_base64.split(",", 1)
-                if "audio/" in header:
-                    mime_type = header.split(":")[1].split(";")[0]
+            if audio_bytes is None:
+                # Find the data URL header by index (no split copy of the whole string)
+                header_end = audio_base64.find(",", 0, MAX_HEADER_LEN)
+                if header_end >= 0:
+                    match = DATA_URL_RE.match(audio_base64, 0, header_end)
+                    if match and not mime_type:
+                        mime_type = match.group(1)
+                
+                # Multi-MB decode runs in a thread, not on the event loop
+                audio_bytes = await asyncio.to_thread(decode_base64_chunked, audio_base64, header_end + 1)
             
             # Create inline data part
             audio_part = types.Part.from_bytes(
-                data=base64.b64decode(base64_data),
-                mime_type=mime_type
+                data=audio_bytes,
+                mime_type=mime_type or "audio/webm"
             )
             
             # Use Gemini to transcribe
@@ -78,23 +196,19 @@ class GeminiService:
 If they are describing a video they want to create, capture all the details.
 Return ONLY the transcription, no additional commentary."""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+            stream = await self.client.aio.models.generate_content_stream(
+                model=TEXT_MODEL,
                 contents=[prompt, audio_part]
             )
-            
-            # Extract text from response
-            if response and hasattr(response, 'text') and response.text:
-                transcription = response.text.strip()
-                print(f"Audio transcribed: {transcription[:100]}...")
-                return transcription
-            else:
-                print("No text in response")
-                return ""
+            async for chunk in stream:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
                         
         except Exception as e:
+            if parts:
+                raise
             print(f"Audio transcription failed: {e}")
-            return ""
     
     async def understand_intent(self, user_input: str) -> Dict[str, Any]:
         """
@@ -104,56 +218,23 @@ Return ONLY the transcription, no additional commentary."""
             return self._fallback_intent(user_input)
         
         try:
-            prompt = f"""Analyze this video creation request and extract the key elements.
-            
-User request: "{user_input}"
+            prompt = f'{UNDERSTAND_INTENT_PREAMBLE}\n\nUser request: "{user_input}"'
 
-Return a JSON object with these fields:
-- topic: main subject of the video
-- video_type: type (explainer, story, advertisement, tutorial, etc.)
-- style: visual style (cinematic, animated, documentary, etc.)
-- mood: emotional tone (exciting, calm, dramatic, etc.)
-- duration: suggested duration in seconds (default 8 for Veo)
-- key_elements: list of important visual elements to include
-
-Return ONLY valid JSON, no markdown formatting."""
-
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
+            response = await self.client.aio.models.generate_content(model=TEXT_MODEL, contents=prompt)
             
             # Safely get response text
             if not response or not response.text:
                 print("No text in intent response")
                 return self._fallback_intent(user_input)
+            raw = response.text
             
-            # Parse JSON response
-            text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if "```json" in text:
-                text = text.split("```json")[1].split("```")[0]
-            elif "```" in text:
-                parts = text.split("```")
-                if len(parts) >= 2:
-                    text = parts[1]
-            
-            text = text.strip()
-            
-            import json
-            intent = json.loads(text)
-            intent["original_input"] = user_input
+            # Parse JSON response, removing a markdown code block if present
+            parsed = orjson.loads(strip_json_fence(raw))
+            parsed.setdefault("topic", user_input[:100])
+            parsed["original_input"] = user_input
             
-            # Ensure required fields exist
-            intent.setdefault("topic", user_input[:100])
-            intent.setdefault("video_type", "short video")
-            intent.setdefault("style", "cinematic")
-            intent.setdefault("mood", "engaging")
-            intent.setdefault("duration", 8)
-            intent.setdefault("key_elements", [])
-            
-            return intent
+            # Defaults + type checks in one pass; malformed model output raises and falls back
+            return VideoIntent.model_validate(parsed).model_dump()
             
         except Exception as e:
             print(f"Intent understanding failed: {e}")
@@ -162,11 +243,8 @@ Return ONLY valid JSON, no markdown formatting."""
     def _fallback_intent(self, user_input: str) -> Dict[str, Any]:
         """Fallback intent extraction without API"""
         return {
+            **_FALLBACK_TEMPLATE,
             "topic": user_input[:100],
-            "video_type": "short video",
-            "style": "cinematic",
-            "mood": "engaging",
-            "duration": 8,
             "key_elements": [],
             "original_input": user_input
         }
@@ -182,13 +260,7 @@ Return ONLY valid JSON, no markdown formatting."""
         original_input = intent.get('original_input', '')
         
         try:
-            prompt = f"""You are a video prompt generator. Your task is to convert the user's request into a clear video description for AI video generation.
-
-CRITICAL RULES:
-1. You MUST stay faithful to what the user actually requested
-2. Do NOT add unrelated content or change the subject
-3. If the user's request is vague (like "yeah" or "okay"), just describe a simple, neutral scene
-4. Add visual details (camera angle, lighting) but keep the SUBJECT the same as what user requested
+            prompt = f"""{VIDEO_PROMPT_PREAMBLE}
 
 User's original request: "{original_input}"
 
@@ -196,20 +268,9 @@ Extracted intent:
 - Topic: {intent.get('topic', 'general')}
 - Type: {intent.get('video_type', 'short video')}
 - Style: {intent.get('style', 'cinematic')}
-- Mood: {intent.get('mood', 'neutral')}
-
-Generate a video prompt that:
-1. Matches the user's request exactly
-2. Adds appropriate visual details (camera movement, lighting)
-3. Is 1-3 sentences long
-4. Does NOT invent new subjects or stories
-
-Return ONLY the prompt text."""
+- Mood: {intent.get('mood', 'neutral')}"""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
+            response = await self.client.aio.models.generate_content(model=TEXT_MODEL, contents=prompt)
             
             # Safely get response text
             if not response or not response.text:
@@ -226,11 +287,12 @@ Return ONLY the prompt text."""
     
     def _fallback_video_prompt(self, intent: Dict[str, Any]) -> str:
         """Create a simple video prompt without API"""
-        topic = intent.get("topic", "beautiful scene")
-        style = intent.get("style", "cinematic")
-        mood = intent.get("mood", "engaging")
-        
-        return f"A {style} video showing {topic}, {mood} atmosphere, high quality, 4K, smooth camera movement"
+        # Strings keep the cache key hashable (model output may put lists here)
+        return _format_fallback_prompt(
+            str(intent.get("topic", "beautiful scene")),
+            str(intent.get("style", "cinematic")),
+            str(intent.get("mood", "engaging"))
+        )
     
     async def generate_video(
         self, 
@@ -260,7 +322,7 @@ Return ONLY the prompt text."""
             print(f"Prompt: {prompt[:100]}...")
             
             # Start video generation with Veo 2
-            operation = self.client.models.generate_videos(
+            operation = await self.client.aio.models.generate_videos(
                 model="veo-2.0-generate-001",
                 prompt=prompt,
                 config=types.GenerateVideosConfig(
@@ -270,19 +332,30 @@ Return ONLY the prompt text."""
                 )
             )
             
-            # Wait for video generation to complete
+            # Wait for video generation to complete, polling with exponential backoff
+            # (1s, 1.6s, 2.6s, ... capped at 15s, plus jitter) so fast jobs finish sooner
             max_wait = 300  # 5 minutes max
-            wait_time = 0
+            wait_time = 0.0
+            poll_count = 0
             
             while not operation.done and wait_time < max_wait:
-                await asyncio.sleep(10)
-                wait_time += 10
-                operation = self.client.operations.get(operation)
-                progress_pct = min(90, 60 + int(wait_time / 300 * 30))
-                print(f"Video generation progress... ({wait_time}s)")
+                delay = min(15.0, 1.6 ** poll_count) + random.uniform(0, 0.5)
+                await asyncio.sleep(delay)
+                wait_time += delay
+                poll_count += 1
+                operation = await self.client.aio.operations.get(operation)
+                
+                # Use the operation's own progress when reported, else estimate from elapsed time
+                metadata = getattr(operation, "metadata", None) or {}
+                reported = metadata.get("progress_percent", metadata.get("progressPercent"))
+                if reported is not None:
+                    progress_pct = 60 + int(float(reported) / 100 * 30)
+                else:
+                    progress_pct = min(90, 60 + int(wait_time / 300 * 30))
+                print(f"Video generation progress... ({wait_time:.0f}s)")
                 
                 if on_progress:
-                    await on_progress(progress_pct, f"Generating video... ({wait_time}s)")
+                    await on_progress(progress_pct, f"Generating video... ({wait_time:.0f}s)")
             
             if not operation.done:
                 print("Video generation timed out")
@@ -331,24 +404,34 @@ Return ONLY the prompt text."""
                 # Check if video has URI (download from URL)
                 if hasattr(video_obj, 'uri') and video_obj.uri:
                     print(f"Downloading from URI: {video_obj.uri}")
-                    import httpx
                     
                     # Download video from URI with redirect following and API key
                     headers = {
                         "x-goog-api-key": self.api_key
                     }
-                    async with httpx.AsyncClient(follow_redirects=True, timeout=120) as client:
-                        response = await client.get(video_obj.uri, headers=headers)
+                    async with self.http.stream("GET", video_obj.uri, headers=headers) as response:
                         print(f"Download response: HTTP {response.status_code}")
-                        if response.status_code == 200:
-                            with open(output_path, "wb") as f:
-                                f.write(response.content)
-                            print(f"Video saved to: {output_path} ({len(response.content)} bytes)")
-                            return str(output_path)
-                        else:
+                        if response.status_code != 200:
+                            await response.aread()
                             print(f"Failed to download video: HTTP {response.status_code}")
                             print(f"Response: {response.text[:500]}")
                             return None
+                        
+                        # Stream to disk chunk by chunk; writes run off the event loop
+                        total = int(response.headers.get("content-length") or 0)
+                        received = 0
+                        with open(output_path, "wb") as f:
+                            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                                await asyncio.to_thread(f.write, chunk)
+                                received += len(chunk)
+                                if on_progress and total:
+                                    await on_progress(
+                                        90 + int(received / total * 9),
+                                        f"Downloading video... ({received * 100 // total}%)"
+                                    )
+                    
+                    print(f"Video saved to: {output_path} ({received} bytes)")
+                    return str(output_path)
                 
                 # Check if video has bytes directly
                 elif hasattr(video_obj, 'video_bytes') and video_obj.video_bytes:
@@ -0,0 +1,118 @@
+"""
+LLM Cache - Deterministic exact-match cache for agent Gemini text responses
+In-memory LRU in front of an optional SQLite table (aiosqlite) that survives restarts
+"""
+from typing import Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import time
+
+from config import settings
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+# Responses kept in process memory (least recently used dropped first)
+MAX_MEMORY_ENTRIES = 1024
+
+
+def cache_key(model: str, prompt: str) -> str:
+    """SHA-256 of the canonical JSON request (same model + prompt -> same key)"""
+    payload = json.dumps({"model": model, "prompt": prompt}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Exact-match response cache.
+    Lookups hit the in-memory dict first, then the llm_cache SQLite table.
+    Without aiosqlite installed the cache is memory-only.
+    """
+
+    def __init__(self, path: str = settings.LLM_CACHE_PATH, ttl: int = settings.LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        # key -> (expires_at, response text)
+        self._memory: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._db = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        """Open the SQLite database on first use"""
+        if self._db is None and aiosqlite is not None:
+            async with self._connect_lock:
+                if self._db is None:
+                    Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                    db = await aiosqlite.connect(self.path)
+                    await db.execute(
+                        "CREATE TABLE IF NOT EXISTS llm_cache ("
+                        "hash TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at INTEGER NOT NULL)"
+                    )
+                    await db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (int(time.time()),))
+                    await db.commit()
+                    self._db = db
+        return self._db
+
+    async def get(self, key: str) -> Optional[str]:
+        """Cached response text for key, or None"""
+        now = int(time.time())
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] >= now:
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+
+        try:
+            db = await self._connect()
+            if db is not None:
+                async with db.execute(
+                    "SELECT response, expires_at FROM llm_cache WHERE hash = ? AND expires_at >= ?",
+                    (key, now)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                if row is not None:
+                    self._remember(key, row[1], row[0])
+                    return row[0]
+        except Exception as e:
+            print(f"LLM cache read failed: {e}")
+
+        return None
+
+    async def set(self, key: str, response: str):
+        """Store response text for key"""
+        expires_at = int(time.time()) + self.ttl
+        self._remember(key, expires_at, response)
+
+        try:
+            db = await self._connect()
+            if db is not None:
+                await db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (hash, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at)
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"LLM cache write failed: {e}")
+
+    def _remember(self, key: str, expires_at: int, response: str):
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > MAX_MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    async def aclose(self):
+        """Close the database connection (app shutdown)"""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+# Singleton instance
+llm_cache = LLMCache()
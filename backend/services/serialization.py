@@ -0,0 +1,25 @@
+"""
+Shared JSON encoding - one set of orjson options for HTTP responses,
+WebSocket frames and cached payloads
+"""
+from pathlib import Path
+from typing import Any
+
+import orjson
+
+# Datetimes are timezone-aware UTC; emit RFC 3339 with a "Z" suffix
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson doesn't serialize natively"""
+    if isinstance(obj, Path):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj to JSON bytes"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
@@ -2,12 +2,32 @@
 Simple Task Manager - No complex dependencies
 Uses in-memory storage and asyncio for task execution
 """
-from typing import Dict, Any, Optional, Callable, List
-from datetime import datetime
+from typing import Dict, Any, Optional, Callable, List, Set, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 import asyncio
+import contextvars
+import time
 import uuid
 
+import orjson
+
+from config import settings
 from models.schemas import TaskStatus, TaskPhase
+from .serialization import dumps
+from .task_store import TaskStore, aiosqlite
+
+# Time-ordered UUIDv7 where the stdlib has it (Python 3.14+), random UUIDv4 otherwise
+_new_uuid = getattr(uuid, "uuid7", uuid.uuid4)
+
+# Only finished tasks are reaped/evicted; unfinished ones are never dropped
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+# Minimum spacing of updated_at refreshes from progress-only updates
+UPDATED_AT_INTERVAL = 0.1
+# Seconds between write-behind flushes of changed tasks to the task store
+PERSIST_INTERVAL = 0.5
+# Longest a single subscriber may take to handle one update
+SUBSCRIBER_TIMEOUT = 5.0
 
 
 class Task:
@@ -23,11 +43,14 @@ class Task:
         self.result: Optional[Dict[str, Any]] = None
         self.error: Optional[str] = None
         self.transcription: Optional[str] = None  # Store transcription
-        self.created_at = datetime.now()
-        self.updated_at = datetime.now()
-    
-    def to_dict(self) -> Dict[str, Any]:
-        result = {
+        self.input_path: Optional[str] = None  # input_data on disk, once persisted
+        self.created_at = datetime.now(timezone.utc)
+        self.updated_at = self.created_at
+        # Monotonic clock for durations and for throttling updated_at refreshes
+        self._created_monotonic = time.monotonic()
+        self._updated_monotonic = self._created_monotonic
+        # Status-endpoint view, patched in place by TaskManager.update_task
+        self._snapshot: Dict[str, Any] = {
             "task_id": self.id,
             "status": self.status.value,
             "phase": self.phase.value,
@@ -35,33 +58,232 @@ class Task:
             "message": self.message,
             "result": self.result,
             "error": self.error,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat()
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
         }
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Status fields as a plain dict (no pydantic model construction)"""
+        return self._snapshot
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Copy of the snapshot (no per-call enum/field lookups), plus transcription"""
+        result = self._snapshot.copy()
         # Include transcription if available
         if self.transcription:
             result["transcription"] = self.transcription
         return result
+    
+    def to_row(self) -> Tuple:
+        """Row for the task store (columns in task_store.COLUMNS order)"""
+        return (
+            self.id,
+            self.status.value,
+            self.phase.value,
+            self.progress,
+            self.message,
+            dumps(self.result) if self.result is not None else None,
+            self.error,
+            self.transcription,
+            self.input_path,
+            _to_us(self.created_at),
+            _to_us(self.updated_at)
+        )
+    
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Task":
+        """Rebuild a task from a task store row (input_data stays on disk)"""
+        task = cls(row["id"], {})
+        task.status = TaskStatus(row["status"])
+        task.phase = TaskPhase(row["phase"])
+        task.progress = row["progress"]
+        task.message = row["message"]
+        task.result = orjson.loads(row["result"]) if row["result"] is not None else None
+        task.error = row["error"]
+        task.transcription = row["transcription"]
+        task.input_path = row["input_path"]
+        task.created_at = _from_us(row["created_at"])
+        task.updated_at = _from_us(row["updated_at"])
+        task._snapshot.update(
+            status=task.status.value,
+            phase=task.phase.value,
+            progress=task.progress,
+            message=task.message,
+            result=task.result,
+            error=task.error,
+            created_at=task.created_at,
+            updated_at=task.updated_at
+        )
+        return task
+
+
+def _to_us(dt: datetime) -> int:
+    """Epoch microseconds (exact round trip; keeps same-millisecond tasks in order)"""
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 
 class TaskManager:
     """
     Simple in-memory task manager.
     Manages task lifecycle and provides updates via callbacks.
+    Started tasks are queued and run by a fixed pool of worker coroutines,
+    so at most max_workers generations are in flight at once.
+    The store is bounded: at most max_tasks are kept (oldest finished evicted
+    first; new tasks are refused when all are unfinished) and finished tasks
+    older than the TTL are reaped.
+    With aiosqlite installed and TASK_DB_PATH set, changes are written behind to
+    SQLite and memory acts as the cache of hot tasks.
     """
     
     def __init__(self):
-        self.tasks: Dict[str, Task] = {}
+        # Insertion (creation) order, which list_tasks pagination relies on
+        self.tasks: "OrderedDict[str, Task]" = OrderedDict()
+        self.max_tasks = settings.MAX_TASKS
+        self.ttl = timedelta(seconds=settings.TASK_TTL_SECONDS)
         self._status_handlers: Dict[str, List[Callable]] = {}  # task_id -> handlers
-        self._running_tasks: Dict[str, asyncio.Task] = {}
+        # task_id -> handlers called as handler(data, payload) with the update pre-encoded as JSON
+        self._encoded_handlers: Dict[str, List[Callable]] = {}
+        self.max_workers = settings.MAX_CONCURRENT_GENERATIONS
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Encoded full task list, rebuilt only after a mutation bumps _version
+        self._version = 0
+        self._tasks_json: Optional[bytes] = None
+        self._tasks_json_version = -1
+        # Write-behind persistence: changed tasks (held until flushed) and deleted ids
+        self.store: Optional[TaskStore] = (
+            TaskStore(settings.TASK_DB_PATH) if aiosqlite is not None and settings.TASK_DB_PATH else None
+        )
+        self._dirty: Dict[str, Task] = {}
+        self._deleted: Set[str] = set()
+    
+    async def open(self):
+        """Open the task store and load the most recent tasks (app startup)"""
+        if self.store is None:
+            return
+        await self.store.open()
+        for row in await self.store.load_recent(self.max_tasks):
+            task = Task.from_row(row)
+            if task.status not in FINISHED_STATUSES:
+                # Its processor died with the previous process (single worker, see main.py)
+                task.status = TaskStatus.FAILED
+                task.error = task._snapshot["error"] = "Interrupted by server restart"
+                task._snapshot["status"] = task.status.value
+                self._dirty[task.id] = task
+            self.tasks.setdefault(task.id, task)
+        self._version += 1
+    
+    async def flush(self):
+        """Write changed tasks (and their inputs) to the task store"""
+        if self.store is None or not (self._dirty or self._deleted):
+            return
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, set()
+        
+        try:
+            # Move input payloads (audio blobs) out of the heap on first save
+            for task in dirty.values():
+                if task.input_path is None and task.input_data:
+                    task.input_path = await asyncio.to_thread(self.store.write_input, task.id, task.input_data)
+                    task.input_data = {}
+            await self.store.save_many([task.to_row() for task in dirty.values() if task.id not in deleted])
+            if deleted:
+                await self.store.delete_many(deleted)
+        except Exception as e:
+            print(f"[TaskManager] Persisting tasks failed: {e}")
+            # Retry on the next flush (newer changes win)
+            self._dirty = {**dirty, **self._dirty}
+            self._deleted |= deleted
+    
+    async def run_persister(self, interval: float = PERSIST_INTERVAL):
+        """Background loop flushing changes every `interval` seconds (started in app lifespan)"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+    
+    async def aclose(self):
+        """Flush pending changes and close the task store (app shutdown)"""
+        if self.store is not None:
+            await self.flush()
+            await self.store.aclose()
     
-    def create_task(self, input_data: Dict[str, Any]) -> Task:
-        """Create a new task"""
-        task_id = str(uuid.uuid4())
+    async def fetch_task(self, task_id: str) -> Optional[Task]:
+        """get_task, falling back to the task store (tasks evicted or owned by another worker)"""
+        task = self.tasks.get(task_id)
+        if task is not None or self.store is None:
+            return task
+        row = await self.store.load(task_id)
+        return Task.from_row(row) if row is not None else None
+    
+    def create_task(self, input_data: Dict[str, Any]) -> Optional[Task]:
+        """Create a new task (None if the store is full of unfinished tasks)"""
+        if len(self.tasks) >= self.max_tasks and not self._evict_one():
+            return None
+        task_id = _new_uuid().hex
         task = Task(task_id, input_data)
         self.tasks[task_id] = task
+        self._version += 1
+        self._mark_dirty(task)
         return task
     
+    def _mark_dirty(self, task: Task):
+        if self.store is not None:
+            self._dirty[task.id] = task
+    
+    def _evict_one(self) -> bool:
+        """Drop the oldest finished task; returns False if none has finished (live work is never evicted)"""
+        victim = next((tid for tid, t in self.tasks.items() if t.status in FINISHED_STATUSES), None)
+        if victim is None:
+            return False
+        del self.tasks[victim]
+        self._drop_handlers(victim)
+        return True
+    
+    def delete_task(self, task_id: str) -> bool:
+        """Remove a task; returns False if it didn't exist"""
+        if self.tasks.pop(task_id, None) is None:
+            return False
+        self._drop_handlers(task_id)
+        self._forget(task_id)
+        self._version += 1
+        return True
+    
+    def sweep(self) -> int:
+        """Drop finished tasks not updated within the TTL; returns how many were removed"""
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        expired = [
+            tid for tid, t in self.tasks.items()
+            if t.status in FINISHED_STATUSES and t.updated_at < cutoff
+        ]
+        for tid in expired:
+            del self.tasks[tid]
+            self._drop_handlers(tid)
+            self._forget(tid)
+        if expired:
+            self._version += 1
+        return len(expired)
+    
+    def _forget(self, task_id: str):
+        """Schedule a task's removal from the task store"""
+        if self.store is not None:
+            self._dirty.pop(task_id, None)
+            self._deleted.add(task_id)
+    
+    async def run_sweeper(self, interval: float = 60):
+        """Background loop calling sweep() every `interval` seconds (started in app lifespan)"""
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                print(f"[TaskManager] Swept {removed} finished tasks")
+    
     def get_task(self, task_id: str) -> Optional[Task]:
         """Get task by ID"""
         return self.tasks.get(task_id)
@@ -82,48 +304,90 @@ class TaskManager:
         if not task:
             return
         
+        snapshot = task._snapshot
         if status is not None:
             task.status = status
+            snapshot["status"] = status.value
         if phase is not None:
             task.phase = phase
+            snapshot["phase"] = phase.value
         if progress is not None:
-            task.progress = progress
+            task.progress = snapshot["progress"] = progress
         if message is not None:
-            task.message = message
+            task.message = snapshot["message"] = message
         if result is not None:
-            task.result = result
+            task.result = snapshot["result"] = result
         if error is not None:
-            task.error = error
+            task.error = snapshot["error"] = error
         if transcription is not None:
             task.transcription = transcription
+            # Transcribed - the base64 audio (often the largest field) is no longer needed
+            task.input_data.pop("audio_data", None)
         
-        task.updated_at = datetime.now()
+        # Refresh the wall-clock timestamp at most every UPDATED_AT_INTERVAL seconds
+        # during progress ticks, but always on a status change
+        now = time.monotonic()
+        if status is not None or now - task._updated_monotonic >= UPDATED_AT_INTERVAL:
+            task._updated_monotonic = now
+            task.updated_at = snapshot["updated_at"] = datetime.now(timezone.utc)
+        self._version += 1
+        self._mark_dirty(task)
     
-    def subscribe(self, task_id: str, handler: Callable):
-        """Subscribe to task updates"""
-        if task_id not in self._status_handlers:
-            self._status_handlers[task_id] = []
-        self._status_handlers[task_id].append(handler)
+    def subscribe(self, task_id: str, handler: Callable, encoded: bool = False):
+        """
+        Subscribe to task updates.
+        With encoded=True the handler is called as handler(data, payload), where payload
+        is the update serialized once to JSON bytes for all such subscribers.
+        A handler that returns False (e.g. its connection closed) is unsubscribed.
+        """
+        handlers = self._encoded_handlers if encoded else self._status_handlers
+        if task_id not in handlers:
+            handlers[task_id] = []
+        handlers[task_id].append(handler)
     
     def unsubscribe(self, task_id: str, handler: Callable):
         """Unsubscribe from task updates"""
-        if task_id in self._status_handlers:
-            try:
-                self._status_handlers[task_id].remove(handler)
-            except ValueError:
-                pass
+        for handlers in (self._status_handlers, self._encoded_handlers):
+            if task_id in handlers:
+                try:
+                    handlers[task_id].remove(handler)
+                except ValueError:
+                    pass
+                if not handlers[task_id]:
+                    del handlers[task_id]
+    
+    def _drop_handlers(self, task_id: str):
+        self._status_handlers.pop(task_id, None)
+        self._encoded_handlers.pop(task_id, None)
     
     async def notify_subscribers(self, task_id: str, data: Dict[str, Any]):
         """Notify all subscribers of task updates"""
-        handlers = self._status_handlers.get(task_id, [])
-        for handler in handlers:
+        calls = [(handler, (data,)) for handler in self._status_handlers.get(task_id, [])]
+        encoded_handlers = self._encoded_handlers.get(task_id)
+        if encoded_handlers:
+            payload = dumps(data)
+            calls += [(handler, (data, payload)) for handler in encoded_handlers]
+        
+        # Sync handlers run inline (they usually touch loop-bound objects);
+        # coroutine handlers fan out concurrently so one slow subscriber can't stall the others
+        sync_calls = [(h, args) for h, args in calls if not asyncio.iscoroutinefunction(h)]
+        async_calls = [(h, args) for h, args in calls if asyncio.iscoroutinefunction(h)]
+        results = []
+        for handler, args in sync_calls:
             try:
-                if asyncio.iscoroutinefunction(handler):
-                    await handler(data)
-                else:
-                    handler(data)
+                results.append(handler(*args))
             except Exception as e:
-                print(f"Error notifying subscriber: {e}")
+                results.append(e)
+        results += await asyncio.gather(
+            *[asyncio.wait_for(handler(*args), timeout=SUBSCRIBER_TIMEOUT) for handler, args in async_calls],
+            return_exceptions=True
+        )
+        
+        for (handler, _), result in zip(sync_calls + async_calls, results):
+            if result is False:
+                self.unsubscribe(task_id, handler)
+            elif isinstance(result, Exception):
+                print(f"Error notifying subscriber: {result!r}")
     
     async def run_task(self, task_id: str, processor: Callable) -> Dict[str, Any]:
         """
@@ -145,13 +409,11 @@ class TaskManager:
                     task_id,
                     phase=phase,
                     progress=update.get("progress", 0),
-                    message=update.get("message", "")
+                    message=update.get("message", ""),
+                    # Save transcription to task if present
+                    transcription=(update.get("data") or {}).get("transcription") or None
                 )
                 
-                # Save transcription to task if present
-                if update.get("data") and update["data"].get("transcription"):
-                    task.transcription = update["data"]["transcription"]
-                
                 # Notify WebSocket subscribers
                 await self.notify_subscribers(task_id, {
                     "type": "progress",
@@ -202,14 +464,54 @@ class TaskManager:
             return {"success": False, "error": str(e)}
     
     def start_task_async(self, task_id: str, processor: Callable):
-        """Start a task in the background"""
-        async_task = asyncio.create_task(self.run_task(task_id, processor))
-        self._running_tasks[task_id] = async_task
-        return async_task
+        """Queue a task for the worker pool (stays PENDING until a worker picks it up)"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        
+        # Workers start lazily (no event loop at import time) and are replaced if one died
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.max_workers:
+            self._workers.append(asyncio.create_task(self._worker()))
+        
+        self._queue.put_nowait((task_id, processor))
+    
+    async def _worker(self):
+        """Run queued tasks one at a time, each in its own context (agent handlers are context variables)"""
+        while True:
+            task_id, processor = await self._queue.get()
+            try:
+                await asyncio.create_task(self.run_task(task_id, processor), context=contextvars.copy_context())
+            except Exception as e:
+                print(f"Task worker error: {e}")
+            finally:
+                self._queue.task_done()
     
     def get_all_tasks(self) -> List[Dict[str, Any]]:
         """Get all tasks as dictionaries"""
         return [task.to_dict() for task in self.tasks.values()]
+    
+    def tasks_json(self) -> bytes:
+        """All tasks as an encoded JSON array, cached until the next mutation"""
+        if self._tasks_json_version != self._version:
+            self._tasks_json = dumps([task.to_dict() for task in self.tasks.values()])
+            self._tasks_json_version = self._version
+        return self._tasks_json
+    
+    def list_tasks(self, cursor: Optional[str] = None, limit: Optional[int] = None) -> Optional[List[Task]]:
+        """
+        Snapshot of tasks in creation order, starting after the `cursor` task id.
+        Returns Task objects (not dicts) so callers can serialize lazily,
+        or None if the cursor task no longer exists (deleted, swept or evicted).
+        """
+        tasks = list(self.tasks.values())
+        if cursor:
+            for i, task in enumerate(tasks):
+                if task.id == cursor:
+                    tasks = tasks[i + 1:]
+                    break
+            else:
+                return None
+        return tasks if limit is None else tasks[:limit]
 
 
 # Singleton instance
@@ -0,0 +1,100 @@
+"""
+Task Store - SQLite persistence for TaskManager (aiosqlite)
+Task rows live in the tasks table; input payloads (audio blobs) live on disk
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import asyncio
+
+import orjson
+
+from .serialization import dumps
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+COLUMNS = (
+    "id", "status", "phase", "progress", "message", "result", "error",
+    "transcription", "input_path", "created_at", "updated_at"
+)
+
+_UPSERT = (
+    f"INSERT OR REPLACE INTO tasks ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+
+
+class TaskStore:
+    """
+    Write-behind task table for the (single) server process.
+    Timestamps are stored as integer epoch microseconds, result as JSON.
+    """
+
+    def __init__(self, path: str, inputs_dir: str = "generated/inputs"):
+        self.path = path
+        self.inputs_dir = Path(inputs_dir)
+        self._db = None
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        """Open the database and create the schema"""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.inputs_dir.mkdir(parents=True, exist_ok=True)
+        self._db = await aiosqlite.connect(self.path)
+        self._db.row_factory = aiosqlite.Row
+        # WAL keeps reads from blocking on write-behind flushes
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id TEXT PRIMARY KEY, status TEXT, phase TEXT, progress INT, message TEXT, "
+            "result BLOB, error TEXT, transcription TEXT, input_path TEXT, "
+            "created_at INT, updated_at INT)"
+        )
+        await self._db.execute("CREATE INDEX IF NOT EXISTS tasks_created_at ON tasks (created_at)")
+        await self._db.commit()
+
+    def write_input(self, task_id: str, input_data: Dict[str, Any]) -> str:
+        """Write a task's input payload to disk (blocking; run in a thread)"""
+        path = self.inputs_dir / f"{task_id}.bin"
+        path.write_bytes(dumps(input_data))
+        return str(path)
+
+    def read_input(self, path: str) -> Dict[str, Any]:
+        """Read a task's input payload back (blocking; run in a thread)"""
+        return orjson.loads(Path(path).read_bytes())
+
+    async def save_many(self, rows: List[Tuple]):
+        async with self._lock:
+            await self._db.executemany(_UPSERT, rows)
+            await self._db.commit()
+
+    async def delete_many(self, task_ids: Iterable[str]):
+        ids = [(task_id,) for task_id in task_ids]
+        async with self._lock:
+            await self._db.executemany("DELETE FROM tasks WHERE id = ?", ids)
+            await self._db.commit()
+        await asyncio.to_thread(self._unlink_inputs, [task_id for (task_id,) in ids])
+
+    def _unlink_inputs(self, task_ids: List[str]):
+        for task_id in task_ids:
+            (self.inputs_dir / f"{task_id}.bin").unlink(missing_ok=True)
+
+    async def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        async with self._db.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)) as cursor:
+            row = await cursor.fetchone()
+        return dict(row) if row is not None else None
+
+    async def load_recent(self, limit: int) -> List[Dict[str, Any]]:
+        """Newest `limit` tasks, oldest first"""
+        async with self._db.execute(
+            "SELECT * FROM (SELECT * FROM tasks ORDER BY created_at DESC LIMIT ?) ORDER BY created_at",
+            (limit,)
+        ) as cursor:
+            return [dict(row) async for row in cursor]
+
+    async def aclose(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None